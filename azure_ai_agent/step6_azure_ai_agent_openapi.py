@@ -1,11 +1,16 @@
 # Copyright (c) Microsoft. All rights reserved.
 
 import asyncio
-import json
+import copy
 import os
+import tempfile
+import time
+from pathlib import Path
 from typing import Dict
 from dotenv import load_dotenv
+import aiofiles  # Add import for async file reads
 import aiohttp  # Add import for async HTTP requests
+import orjson  # Add import for fast JSON parsing
 
 from azure.ai.projects.models import OpenApiAnonymousAuthDetails, OpenApiTool
 from azure.identity.aio import DefaultAzureCredential
@@ -30,87 +35,227 @@ USER_INPUTS = [
     "What is the current weather at my location?",
 ]
 
-# Function to get the current public IP address
-async def get_public_ip():
-    async with aiohttp.ClientSession() as session:
-        async with session.get("https://api.ipify.org?format=json") as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get("ip")
-            return None
+# Cap on how many user inputs are processed against the service at once
+_INVOKE_SEMAPHORE = asyncio.Semaphore(4)
 
+# Constant templates, formatted with the current IP at runtime so the literal
+# segments are allocated once per process
+_IP_PARAM_DESCRIPTION_TMPL = "The IP address to look up. Use this exact IP: {ip}"
+_IP_GEO_TOOL_DESCRIPTION_TMPL = (
+    "Determines geolocation based on an IP address. "
+    "Use this to get the user's current location based on IP: {ip}"
+)
+_SYSTEM_MESSAGE_TMPL = """
+You are a helpful assistant that can provide location and weather information.
 
-async def main() -> None:
-    ai_agent_settings = AzureAIAgentSettings.create()
-    
-    # Get the current public IP address
-    current_ip = await get_public_ip()
-    # print(f"# Current public IP: {current_ip}")
+IMPORTANT: When asked about the user's current location or local weather:
+1. First use the get_ip_geo_location tool to determine the user's location from their IP address
+2. The user's IP address is {ip} - always use this exact value
+3. Then use the get_weather tool with the location information if weather is requested
 
-    async with (
-        DefaultAzureCredential() as creds,
-        AzureAIAgent.create_client(credential=creds) as client,
-    ):
-        # 1. Read in the OpenAPI spec files
-        openapi_spec_file_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
-            "azure_ai_agent",
-            "resources",
+Do not try to guess the user's location. ALWAYS use the get_ip_geo_location tool to get accurate information.
+"""
+
+# Shared HTTP session, created lazily and reused across calls so connection
+# pooling and keep-alive amortize the TCP+TLS handshake cost
+_session: aiohttp.ClientSession | None = None
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        # Bound the connector and cache DNS lookups so repeated outbound calls
+        # skip getaddrinfo and can't exhaust connections under fan-out
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=32,
+                ttl_dns_cache=300,
+                use_dns_cache=True,
+            ),
+            timeout=aiohttp.ClientTimeout(total=5),
+            # aiohttp expects a str-returning serializer; orjson still beats
+            # stdlib json.dumps even with the extra decode
+            json_serialize=lambda obj: orjson.dumps(obj).decode(),
         )
-        with open(os.path.join(openapi_spec_file_path, "weather.json")) as weather_file:
-            weather_openapi_spec = json.loads(weather_file.read())
-        
-        # Load and modify the IP geolocation spec to include the API key and current IP
-        with open(os.path.join(openapi_spec_file_path, "ip_geo_location.json")) as ip_geo_location_file:
-            ip_geo_location_openapi_spec = json.loads(ip_geo_location_file.read())
-            
-            # Modify the parameters to include default values
-            for param in ip_geo_location_openapi_spec["paths"]["/ipgeo"]["get"]["parameters"]:
-                if param["name"] == "apiKey":
-                    # Set API key as default in the schema
-                    param["schema"]["default"] = ip_geolocation_key
-                
-                if param["name"] == "ip":
-                    # Set current IP as default and indicate it in description
-                    param["schema"]["default"] = current_ip
-                    param["description"] = f"The IP address to look up. Use this exact IP: {current_ip}"
-
-        # 2. Create OpenAPI tools
+    return _session
+
+
+async def _close_session() -> None:
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+
+# Parsed spec cache so repeated main() invocations don't re-read and re-parse
+# the static JSON files
+_spec_cache: Dict[str, Dict] = {}
+
+
+# Function to validate the structure of a parsed OpenAPI spec once, so the
+# dict traversals below can't fail mid-run with a KeyError
+def _validate_openapi_spec(spec: Dict, path: str) -> None:
+    if not isinstance(spec.get("paths"), dict):
+        raise ValueError(f"OpenAPI spec {path} is missing a 'paths' object")
+    for route, operations in spec["paths"].items():
+        for operation in operations.values():
+            for param in operation.get("parameters", []):
+                if "name" not in param or "schema" not in param:
+                    raise ValueError(
+                        f"OpenAPI spec {path} has a malformed parameter on {route}: {param}"
+                    )
+
+
+# Function to read and parse a JSON file without blocking the event loop,
+# caching the parsed result per path. Files are read as bytes since orjson
+# parses buffers directly without a separate utf-8 decode pass.
+async def _load_json(path: str) -> Dict:
+    if path not in _spec_cache:
+        async with aiofiles.open(path, "rb") as f:
+            spec = orjson.loads(await f.read())
+        _validate_openapi_spec(spec, path)
+        _spec_cache[path] = spec
+    return _spec_cache[path]
+
+
+# Function to run a single user input on its own thread and collect the
+# agent's responses; independent inputs can then be fanned out concurrently
+async def run_one(agent, client, user_input) -> list:
+    async with _INVOKE_SEMAPHORE:
+        thread = await client.agents.create_thread()
+        try:
+            await agent.add_chat_message(thread_id=thread.id, message=user_input)
+            return [
+                content.content
+                async for content in agent.invoke(thread_id=thread.id)
+                if content.role != AuthorRole.TOOL
+            ]
+        finally:
+            await client.agents.delete_thread(thread.id)
+
+
+# Tool definition cache keyed by the public IP baked into the specs, so a
+# long-lived process creating many agents doesn't rebuild identical definitions
+_tool_defs_cache: Dict[str, tuple] = {}
+
+
+# Function to build (and cache) the OpenAPI tool definitions for a given IP
+def _tool_definitions(weather_spec: Dict, ip_geo_spec_template: Dict, current_ip: str) -> tuple:
+    if current_ip not in _tool_defs_cache:
+        # Patch a copy of the IP geolocation spec so the cached template stays pristine
+        ip_geo_spec = copy.deepcopy(ip_geo_spec_template)
+
+        # Index the IP geolocation spec parameters by name and modify them to
+        # include the API key and current IP
+        params_by_name = {
+            param["name"]: param
+            for param in ip_geo_spec["paths"]["/ipgeo"]["get"]["parameters"]
+        }
+        if "apiKey" in params_by_name:
+            # Set API key as default in the schema
+            params_by_name["apiKey"]["schema"]["default"] = ip_geolocation_key
+        if "ip" in params_by_name:
+            # Set current IP as default and indicate it in description
+            params_by_name["ip"]["schema"]["default"] = current_ip
+            params_by_name["ip"]["description"] = _IP_PARAM_DESCRIPTION_TMPL.format(ip=current_ip)
+
         # Weather API with anonymous auth
         weather_auth = OpenApiAnonymousAuthDetails()
         openapi_weather = OpenApiTool(
             name="get_weather",
-            spec=weather_openapi_spec,
+            spec=weather_spec,
             description="Retrieve weather information for a specific city or location name",
             auth=weather_auth,
         )
-        
-        # IP Geolocation API with anonymous auth (API key and IP are now embedded in the spec)
+
+        # IP Geolocation API with anonymous auth (API key and IP are embedded in the spec)
         ip_geo_auth = OpenApiAnonymousAuthDetails()
         openapi_ip_geo_location = OpenApiTool(
             name="get_ip_geo_location",
-            spec=ip_geo_location_openapi_spec,
-            description=f"Determines geolocation based on an IP address. Use this to get the user's current location based on IP: {current_ip}",
+            spec=ip_geo_spec,
+            description=_IP_GEO_TOOL_DESCRIPTION_TMPL.format(ip=current_ip),
             auth=ip_geo_auth,
         )
 
+        _tool_defs_cache[current_ip] = tuple(openapi_weather.definitions) + tuple(
+            openapi_ip_geo_location.definitions
+        )
+    return _tool_defs_cache[current_ip]
+
+
+# Public IP cache file and TTL: the outbound IP rarely changes, so warm
+# restarts can skip the ipify round-trip entirely
+_IP_CACHE_PATH = Path(tempfile.gettempdir()) / "az_agent_ip.json"
+_IP_CACHE_TTL = 3600  # seconds
+
+
+def _read_cached_ip():
+    try:
+        if _IP_CACHE_PATH.exists() and time.time() - _IP_CACHE_PATH.stat().st_mtime < _IP_CACHE_TTL:
+            return orjson.loads(_IP_CACHE_PATH.read_bytes()).get("ip")
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _write_cached_ip(ip: str) -> None:
+    try:
+        _IP_CACHE_PATH.write_bytes(orjson.dumps({"ip": ip}))
+    except OSError:
+        pass
+
+
+# Function to get the current public IP address
+async def get_public_ip():
+    cached_ip = _read_cached_ip()
+    if cached_ip:
+        return cached_ip
+    session = await _get_session()
+    async with session.get("https://api.ipify.org?format=json") as response:
+        if response.status == 200:
+            # Parse the raw bytes with orjson instead of response.json(),
+            # skipping the utf-8 decode and stdlib json dispatch
+            data = orjson.loads(await response.read())
+            ip = data.get("ip")
+            if ip:
+                _write_cached_ip(ip)
+            return ip
+        return None
+
+
+async def main() -> None:
+    ai_agent_settings = AzureAIAgentSettings.create()
+
+    # 1. Read in the OpenAPI spec files while the public IP is fetched, so the
+    # disk reads overlap with the network round-trip
+    openapi_spec_file_path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        "azure_ai_agent",
+        "resources",
+    )
+    current_ip, weather_openapi_spec, ip_geo_location_openapi_spec = await asyncio.gather(
+        get_public_ip(),
+        _load_json(os.path.join(openapi_spec_file_path, "weather.json")),
+        _load_json(os.path.join(openapi_spec_file_path, "ip_geo_location.json")),
+    )
+    # print(f"# Current public IP: {current_ip}")
+
+    async with (
+        DefaultAzureCredential() as creds,
+        AzureAIAgent.create_client(credential=creds) as client,
+    ):
+        # 2. Create (or reuse) the OpenAPI tool definitions for this IP
+        tool_definitions = _tool_definitions(
+            weather_openapi_spec, ip_geo_location_openapi_spec, current_ip
+        )
+
         # Create a system message that instructs the agent how to use these tools
-        system_message = f"""
-        You are a helpful assistant that can provide location and weather information.
-        
-        IMPORTANT: When asked about the user's current location or local weather:
-        1. First use the get_ip_geo_location tool to determine the user's location from their IP address
-        2. The user's IP address is {current_ip} - always use this exact value
-        3. Then use the get_weather tool with the location information if weather is requested
-        
-        Do not try to guess the user's location. ALWAYS use the get_ip_geo_location tool to get accurate information.
-        """
+        system_message = _SYSTEM_MESSAGE_TMPL.format(ip=current_ip)
 
         # 3. Create an agent on the Azure AI agent service with the OpenAPI tools
         agent_definition = await client.agents.create_agent(
             model=ai_agent_settings.model_deployment_name,
             instructions=system_message,
-            tools=openapi_weather.definitions + openapi_ip_geo_location.definitions,
+            tools=list(tool_definitions),
         )
 
         # 4. Create a Semantic Kernel agent for the Azure AI agent
@@ -119,23 +264,34 @@ async def main() -> None:
             definition=agent_definition,
         )
 
-        # 5. Create a new thread on the Azure AI agent service
-        thread = await client.agents.create_thread()
-
         try:
-            for user_input in USER_INPUTS:
-                # 6. Add the user input as a chat message
-                await agent.add_chat_message(thread_id=thread.id, message=user_input)
+            # 5. Run the independent user inputs concurrently, each on its own thread
+            results = await asyncio.gather(
+                *(run_one(agent, client, user_input) for user_input in USER_INPUTS)
+            )
+            # 6. Print the responses in the original input order
+            for user_input, responses in zip(USER_INPUTS, results):
                 print(f"# User: '{user_input}'")
-                # 7. Invoke the agent for the specified thread for response
-                async for content in agent.invoke(thread_id=thread.id):
-                    if content.role != AuthorRole.TOOL:
-                        print(f"# Agent: {content.content}")
+                for response in responses:
+                    print(f"# Agent: {response}")
         finally:
-            # 8. Cleanup: Delete the thread and agent
-            await client.agents.delete_thread(thread.id)
-            await client.agents.delete_agent(agent.id)
+            # 7. Cleanup: Delete the agent and close the shared HTTP session
+            # concurrently; teardown failures are logged rather than raised
+            cleanup_results = await asyncio.gather(
+                client.agents.delete_agent(agent.id),
+                _close_session(),
+                return_exceptions=True,
+            )
+            for result in cleanup_results:
+                if isinstance(result, Exception):
+                    print(f"# Cleanup error: {result}")
 
 
 if __name__ == "__main__":
+    # Use uvloop's libuv-based event loop when available for faster socket I/O
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
@@ -0,0 +1,33 @@
+import os
+
+import streamlit as st
+from azure.ai.inference import ChatCompletionsClient
+from azure.core.credentials import AzureKeyCredential
+
+"""
+Shared inference-client factories for the Streamlit front ends.
+
+Both apps used to build their own ChatCompletionsClient at import; keeping the
+factories here means one client (and one keep-alive connection pool) per
+process, and a single place where endpoint/key wiring can drift.
+"""
+
+
+# instantiate the DeepSeek R1 client
+@st.cache_resource
+def get_ds_client():
+    return ChatCompletionsClient(
+        endpoint=os.environ["DeepSeek_R1_Endpoint"],
+        credential=AzureKeyCredential(os.environ["DeepSeek_R1_Key"]),
+        model="DeepSeek-R1"
+    )
+
+
+# instantiate Azure OpenAI client
+@st.cache_resource
+def get_aoai_client():
+    return ChatCompletionsClient(
+        endpoint=os.environ["AOAI_ENDPOINT"],  # Of the form https://<your-resouce-name>.openai.azure.com/openai/deployments/<your-deployment-name>
+        credential=AzureKeyCredential(os.environ["AOAI_KEY"]),
+        api_version="2024-10-21",  # Azure OpenAI api-version. See https://aka.ms/azsdk/azure-ai-inference/azure-openai-api-versions
+    )
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import orjson
+
+"""
+SQLite-backed conversation store for the Streamlit front ends.
+
+One file per session means the sidebar pays a glob + stat + read + JSON parse
+per session ever created, on every rerun. A single table indexed by mtime
+serves the sidebar listing in one query and point-reads a session by primary
+key, with summaries stored alongside the messages.
+"""
+
+
+class ConversationStore:
+    def __init__(self, db_path):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conv ("
+            "sid TEXT PRIMARY KEY, messages BLOB, summary TEXT, mtime REAL)"
+        )
+        self._conn.commit()
+        # One connection is shared across Streamlit's script threads and the
+        # background writer, so writes are serialized here
+        self._lock = threading.Lock()
+
+    def migrate_dir(self, legacy_dir):
+        """Imports any per-session JSON files from `legacy_dir` not yet in the DB."""
+        legacy_dir = Path(legacy_dir)
+        if not legacy_dir.is_dir():
+            return
+        with self._lock:
+            for conv_file in legacy_dir.glob("*.json"):
+                sid = conv_file.stem
+                exists = self._conn.execute(
+                    "SELECT 1 FROM conv WHERE sid = ?", (sid,)
+                ).fetchone()
+                if not exists:
+                    self._conn.execute(
+                        "INSERT INTO conv (sid, messages, summary, mtime) VALUES (?, ?, NULL, ?)",
+                        (sid, conv_file.read_bytes(), conv_file.stat().st_mtime),
+                    )
+            self._conn.commit()
+
+    def load(self, sid):
+        row = self._conn.execute(
+            "SELECT messages FROM conv WHERE sid = ?", (sid,)
+        ).fetchone()
+        return orjson.loads(row[0]) if row else []
+
+    def save(self, sid, messages, summary=None):
+        """Upserts a session; the summary resets unless supplied, since new
+        messages invalidate a previously computed title."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conv (sid, messages, summary, mtime) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(sid) DO UPDATE SET "
+                "messages = excluded.messages, summary = excluded.summary, mtime = excluded.mtime",
+                (sid, orjson.dumps(messages), summary, time.time()),
+            )
+            self._conn.commit()
+
+    def set_summary(self, sid, summary):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE conv SET summary = ? WHERE sid = ?", (summary, sid)
+            )
+            self._conn.commit()
+
+    def list_recent(self, limit=50, offset=0):
+        """Returns (sid, summary, mtime) for non-empty sessions, newest first."""
+        return self._conn.execute(
+            "SELECT sid, summary, mtime FROM conv "
+            "WHERE length(messages) > 2 ORDER BY mtime DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+
+    def delete(self, sid):
+        with self._lock:
+            self._conn.execute("DELETE FROM conv WHERE sid = ?", (sid,))
+            self._conn.commit()
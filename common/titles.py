@@ -0,0 +1,54 @@
+import hashlib
+import threading
+from pathlib import Path
+
+import orjson
+
+"""
+Process-wide title cache keyed by a hash of the user messages.
+
+Identical conversation prefixes (across sessions or apps) share one summary,
+and the mapping is persisted to title_cache.json so restarts don't re-spend
+LLM calls on conversations that never changed.
+"""
+
+_CACHE_PATH = Path("title_cache.json")
+_cache = None
+# The sidebar backfills titles from a thread pool, so cache reads, mutations
+# and the persisting write all happen under one lock
+_cache_lock = threading.Lock()
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        if _CACHE_PATH.exists():
+            try:
+                _cache = orjson.loads(_CACHE_PATH.read_bytes())
+            except orjson.JSONDecodeError:
+                # A corrupted cache file is only a lost optimization: start
+                # fresh rather than failing every rerun
+                _cache = {}
+        else:
+            _cache = {}
+    return _cache
+
+
+def cached_title(user_messages, summarize):
+    """Returns the title for `user_messages`, calling `summarize` only on a miss."""
+    joined_text = "\n".join(user_messages)
+    digest = hashlib.blake2b(joined_text.encode(), digest_size=16).hexdigest()
+    with _cache_lock:
+        title = _load_cache().get(digest)
+    if title is None:
+        # Summarize outside the lock so concurrent misses don't serialize
+        # their LLM calls; re-check under the lock before persisting
+        title = summarize(user_messages)
+        with _cache_lock:
+            cache = _load_cache()
+            existing = cache.get(digest)
+            if existing is not None:
+                return existing
+            cache[digest] = title
+            _CACHE_PATH.write_bytes(orjson.dumps(cache))
+    return title
@@ -0,0 +1,109 @@
+import os
+from functools import lru_cache
+
+import aiohttp
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.cosmos.aio import CosmosClient
+from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.search.documents import SearchClient
+
+"""
+Shared, lazily constructed Azure SDK clients for the semantic_kernal samples.
+
+Each factory is memoized with lru_cache so every module reuses the same
+credential chain, connection pools and partition metadata caches instead of
+building its own at import time.
+"""
+
+
+@lru_cache(maxsize=1)
+def credential() -> DefaultAzureCredential:
+    """Returns the shared synchronous credential chain."""
+    return DefaultAzureCredential()
+
+
+@lru_cache(maxsize=1)
+def async_credential() -> AsyncDefaultAzureCredential:
+    """Returns the shared asynchronous credential chain."""
+    return AsyncDefaultAzureCredential()
+
+
+class _PooledAioHttpTransport(AioHttpTransport):
+    """AioHttpTransport with a bounded keep-alive pool, built lazily.
+
+    The aiohttp session (and its connector) is only created on first open(),
+    inside the running event loop — constructing it at factory-call time would
+    either raise "no running event loop" or bind the pool to the wrong loop
+    when the factory is called from sync or module scope.
+    """
+
+    async def open(self) -> None:
+        if self.session is None and self._session_owner:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=32,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60,
+                )
+            )
+        await super().open()
+
+
+@lru_cache(maxsize=1)
+def _async_transport() -> AioHttpTransport:
+    """Returns a shared aiohttp transport with a bounded keep-alive pool.
+
+    Reusing one connector across the async clients avoids per-request TCP+TLS
+    handshakes under bursty tool-call load.
+    """
+    return _PooledAioHttpTransport(session=None, session_owner=True)
+
+
+@lru_cache(maxsize=1)
+def cosmos() -> CosmosClient:
+    """Returns the shared async Cosmos client.
+
+    Session consistency and region-local reads via preferred_locations keep
+    request latency down under concurrent tool calls; the Python SDK is
+    Gateway-only, so the shared aiohttp transport supplies the pooling that
+    Direct/TCP mode would in other SDKs.
+    """
+    region = os.getenv("COSMOSDB_REGION")
+    return CosmosClient(
+        os.getenv("COSMOSDB_ENDPOINT"),
+        async_credential(),
+        consistency_level="Session",
+        preferred_locations=[region] if region else None,
+        transport=_async_transport(),
+    )
+
+
+@lru_cache(maxsize=None)
+def container(name: str):
+    """Returns a cached container proxy from the shared Cosmos database."""
+    return cosmos().get_database_client(os.getenv("COSMOSDB_DATABASE")).get_container_client(name)
+
+
+@lru_cache(maxsize=1)
+def search() -> SearchClient:
+    """Returns the shared Azure AI Search client."""
+    key = os.getenv("AZURE_SEARCH_ADMIN_KEY")
+    search_credential = credential() if key is None or key == "" else AzureKeyCredential(key)
+    return SearchClient(
+        endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
+        index_name=os.getenv("AZURE_SEARCH_INDEX"),
+        credential=search_credential,
+    )
+
+
+async def aclose() -> None:
+    """Closes the shared async clients, if they were ever constructed."""
+    if cosmos.cache_info().currsize:
+        await cosmos().close()
+    if async_credential.cache_info().currsize:
+        await async_credential().close()
+    if _async_transport.cache_info().currsize:
+        await _async_transport().close()
@@ -1,19 +1,26 @@
 import os
+import sys
 import asyncio
-import requests
+import httpx
+from dataclasses import dataclass
 from typing import Annotated
 from pathlib import Path, PurePath
-from dotenv import load_dotenv
+from dotenv import dotenv_values
 
 # Get the absolute path to the .env file in the semantic_kernal folder
 current_dir = Path(__file__).parent
 env_path = PurePath(current_dir).joinpath(".env")
 
-print(f"Loading environment variables from: {env_path}")
-load_dotenv(dotenv_path=env_path)
+# Parse the .env file only when the environment isn't already configured
+# (12-factor), merging without overriding preset values
+if not os.getenv("SEND_EMAIL_LOGIC_APP_URL"):
+    for key, value in dotenv_values(env_path).items():
+        if value is not None and key not in os.environ:
+            os.environ[key] = value
 
-print(f"Loaded environment variables from: {env_path}")
-print(f"SEND_EMAIL_LOGIC_APP_URL: {os.getenv('SEND_EMAIL_LOGIC_APP_URL')}")
+if __debug__:
+    print(f"Loaded environment variables from: {env_path}")
+    print(f"SEND_EMAIL_LOGIC_APP_URL: {os.getenv('SEND_EMAIL_LOGIC_APP_URL')}")
 
 from semantic_kernel import Kernel
 from semantic_kernel.agents import ChatCompletionAgent
@@ -22,22 +29,64 @@ from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.contents import ChatHistory, FunctionCallContent, FunctionResultContent
 from semantic_kernel.functions import KernelArguments, kernel_function
 
-SEND_EMAIL_LOGIC_APP_URL = os.getenv("SEND_EMAIL_LOGIC_APP_URL")
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Environment-derived configuration, read once at import."""
+    send_email_url: str
+    deployment_name: str
+    endpoint: str
+    api_version: str
+
+
+SETTINGS = Settings(
+    send_email_url=os.getenv("SEND_EMAIL_LOGIC_APP_URL"),
+    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+    endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
+)
+
+# Cap on concurrent send_email calls so parallel tool invocations can't flood
+# the Logic App endpoint
+_EMAIL_SEMAPHORE = asyncio.Semaphore(8)
+
+# Content item types that mark a chunk as a tool call/result rather than text
+_TOOL_ITEM_TYPES = (FunctionCallContent, FunctionResultContent)
+
+
+def _is_tool_content(content) -> bool:
+    """Returns True when the chunk carries a function call or result item."""
+    for item in content.items:
+        if isinstance(item, _TOOL_ITEM_TYPES):
+            return True
+    return False
 
 # Define a plugin for email assistant functionality
 class EmailAssistantPlugin:
     """A plugin for sending emails and providing conversation recap."""
 
+    def __init__(self):
+        # Reusable async HTTP client so concurrent send_email calls don't block
+        # the event loop and keep-alive connections are shared across requests
+        self._client = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+
+    async def aclose(self):
+        """Closes the underlying HTTP client."""
+        await self._client.aclose()
+
     @kernel_function(description="Send an email to the specified user.")
     async def send_email(
-        self, 
+        self,
         to: Annotated[str, "The recipient's email address."],
         subject: Annotated[str, "The subject of the email."],
         body: Annotated[str, "The body of the email."]
     ) -> Annotated[str, "Result of the email sending operation."]:
         try:
             params = {"to": to, "subject": subject, "body": body}
-            res = requests.post(SEND_EMAIL_LOGIC_APP_URL, json=params)
+            async with _EMAIL_SEMAPHORE:
+                res = await self._client.post(SETTINGS.send_email_url, json=params)
             res.raise_for_status()
             return "Email sent successfully."
         except Exception as e:
@@ -53,14 +102,15 @@ async def main():
     # 1. Create the instance of the Kernel to register the plugin and service
     service_id = "email_assistant"
     kernel = Kernel()
-    kernel.add_plugin(EmailAssistantPlugin(), plugin_name="email")
+    email_plugin = EmailAssistantPlugin()
+    kernel.add_plugin(email_plugin, plugin_name="email")
     
     kernel.add_service(
         AzureChatCompletion(
             service_id=service_id,
-            deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-            endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01")
+            deployment_name=SETTINGS.deployment_name,
+            endpoint=SETTINGS.endpoint,
+            api_version=SETTINGS.api_version
         )
     )
 
@@ -87,22 +137,50 @@ async def main():
     # 4. Create a chat history to hold the conversation
     chat_history = ChatHistory()
 
-    for user_input in USER_INPUTS:
-        # 5. Add the user input to the chat history
-        chat_history.add_user_message(user_input)
-        print(f"# User: {user_input}")
-        
-        # 6. Invoke the agent for a response
-        async for content in agent.invoke(chat_history):
-            print(f"# {content.name}: ", end="")
-            if (
-                not any(isinstance(item, (FunctionCallContent, FunctionResultContent)) for item in content.items)
-                and content.content.strip()
-            ):
-                # We only want to print the content if it's not a function call or result
-                print(f"{content.content}", end="", flush=True)
-        print("")
+    try:
+        for user_input in USER_INPUTS:
+            # 5. Add the user input to the chat history
+            chat_history.add_user_message(user_input)
+            print(f"# User: {user_input}")
+
+            # 6. Invoke the agent for a response: a producer drains the stream
+            # into a queue while a consumer filters and prints, so stdout
+            # latency never backpressures token receipt
+            queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+
+            async def producer():
+                async for content in agent.invoke(chat_history):
+                    await queue.put(content)
+                await queue.put(None)
+
+            async def consumer():
+                # Buffer output so stdout is flushed on newlines rather than
+                # per streamed chunk
+                buffer = []
+                while (content := await queue.get()) is not None:
+                    buffer.append(f"# {content.name}: ")
+                    if not _is_tool_content(content) and content.content.strip():
+                        # We only want to print the content if it's not a function call or result
+                        buffer.append(content.content)
+                    if "\n" in buffer[-1]:
+                        sys.stdout.write("".join(buffer))
+                        sys.stdout.flush()
+                        buffer.clear()
+                buffer.append("\n")
+                sys.stdout.write("".join(buffer))
+                sys.stdout.flush()
+
+            await asyncio.gather(producer(), consumer())
+    finally:
+        # 7. Close the plugin's HTTP client
+        await email_plugin.aclose()
 
 
 if __name__ == "__main__":
+    # Use uvloop's libuv-based event loop when available for faster socket I/O
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
@@ -1,24 +1,30 @@
 import os
+import sys
 import asyncio
 from pathlib import Path, PurePath
 from dotenv import load_dotenv
-from azure.cosmos import CosmosClient, PartitionKey, exceptions
-from azure.identity import DefaultAzureCredential
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
 from typing import Dict, List, Optional, Union, Annotated
 import logging
+import time
 import uuid
 from datetime import datetime, timezone, timedelta
 
+logger = logging.getLogger(__name__)
+
 # Get the absolute path to the .env file in the semantic_kernal folder
 current_dir = Path(__file__).parent
 env_path = PurePath(current_dir).joinpath(".env")
 
-print(f"Loading environment variables from: {env_path}")
-load_dotenv(dotenv_path=env_path)
+# Parse the .env file only once per process, even when several agent modules
+# are imported together
+if not os.environ.get("_ENV_LOADED"):
+    load_dotenv(dotenv_path=env_path)
+    os.environ["_ENV_LOADED"] = "1"
 
-# Add logging to verify environment variables are loaded
-print(f"Loaded environment variables from: {env_path}")
-print(f"COSMOSDB_ENDPOINT: {os.getenv('COSMOSDB_ENDPOINT')}")
+logger.debug("Loaded environment variables from: %s", env_path)
+logger.debug("COSMOSDB_ENDPOINT: %s", os.getenv("COSMOSDB_ENDPOINT"))
 
 from semantic_kernel import Kernel
 from semantic_kernel.agents import ChatCompletionAgent
@@ -27,33 +33,60 @@ from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.contents import ChatHistory, FunctionCallContent, FunctionResultContent
 from semantic_kernel.functions import KernelArguments, kernel_function
 
-# CosmosDB Configuration
-credential = DefaultAzureCredential()
-cosmos_endpoint = os.getenv("COSMOSDB_ENDPOINT")
-cosmos_client = CosmosClient(cosmos_endpoint, credential)
-database_name = os.getenv("COSMOSDB_DATABASE")
-database = cosmos_client.create_database_if_not_exists(id=database_name)
+# CosmosDB Configuration: the async client, credential and container proxies
+# are shared singletons from _clients so all agent modules reuse one pool
+from _clients import container as get_container, aclose as close_clients
+
 customer_container_name = "Customer"
 purchase_container_name = "Purchases"
 product_container_name = "Product"
 
+# Resolve the container proxies from inside the tool coroutines: the first
+# call builds the shared Cosmos client and its aiohttp pool, which must happen
+# on the running loop rather than at import. _clients.container memoizes the
+# proxies, so every call after the first reuses the same objects.
+def _customer_container():
+    return get_container(customer_container_name)
+
+
+def _purchase_container():
+    return get_container(purchase_container_name)
+
+
+def _product_container():
+    return get_container(product_container_name)
+
+
+async def _query_to_list(container, query, parameters=None, **kwargs):
+    """Materializes an async Cosmos query into a list of items."""
+    return [
+        item
+        async for item in container.query_items(query=query, parameters=parameters, **kwargs)
+    ]
+
+
+# In-process TTL cache for product-by-id reads: products are read-mostly
+# reference data, so repeated lookups skip Cosmos while the entry is fresh
+_product_cache: Dict[str, tuple] = {}
+_PRODUCT_CACHE_TTL = 300  # seconds
+
+
+async def _get_product(container, product_id):
+    """Point-reads a product by id, serving repeats from the TTL cache."""
+    now = time.monotonic()
+    entry = _product_cache.get(product_id)
+    if entry and now - entry[0] < _PRODUCT_CACHE_TTL:
+        return entry[1]
+    item = await container.read_item(item=product_id, partition_key=product_id)
+    _product_cache[product_id] = (now, item)
+    return item
+
 class DatabasePlugin:
     """A plugin for interacting with the database."""
     
     def __init__(self, customer_id: str):
         self.customer_id = customer_id
 
-    def validate_customer_exists(self, container) -> bool:
-        """Validates if a customer exists in the database."""
-        query = "SELECT VALUE COUNT(1) FROM c WHERE c.customer_id = @customer_id"
-        parameters = [{"name": "@customer_id", "value": self.customer_id}]
-        result = list(container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        return result[0] > 0 if result else False
-
     @kernel_function(description="Create a new purchase record in the Purchases container.")
     async def create_purchases_record(
         self, 
@@ -70,10 +103,16 @@ class DatabasePlugin:
             # Otherwise, if a product_name is provided in purchase_record, derive product_id from it
             elif "product_name" in purchase_record:
                 product_name = purchase_record["product_name"]
-                product_container = database.get_container_client(product_container_name)
-                query = "SELECT TOP 1 * FROM c WHERE CONTAINS(c.name, @name)"
+                # Exact match first: equality is index-served, while CONTAINS
+                # forces a scan — only fall back when nothing matches.
+                # Project only product_id; the full document is never consumed here.
+                query = "SELECT TOP 1 c.product_id FROM c WHERE c.name = @name"
                 query_params = [{"name": "@name", "value": product_name}]
-                results = list(product_container.query_items(query=query, parameters=query_params, enable_cross_partition_query=True))
+                results = await _query_to_list(_product_container(), query, query_params)
+                if not results:
+                    logging.debug("Product name %r missed the exact-match fast path", product_name)
+                    query = "SELECT TOP 1 c.product_id FROM c WHERE CONTAINS(LOWER(c.name), LOWER(@name))"
+                    results = await _query_to_list(_product_container(), query, query_params)
                 if results:
                     purchase_record["product_id"] = results[0]["product_id"]
                     # Optionally remove product_name to avoid redundancy
@@ -81,58 +120,68 @@ class DatabasePlugin:
                 else:
                     return f"Product with name '{product_name}' not found. Please check the product name."
 
-        container = database.get_container_client(purchase_container_name)
-        product_container = database.get_container_client(product_container_name)
-        
-        # Validate customer exists
-        customer_container = database.get_container_client(customer_container_name)
-        if not self.validate_customer_exists(customer_container):
-            return f"Customer with ID {self.customer_id} not found"
-        
-        # Get product details
-        if "product_id" in purchase_record:
-            product_query = "SELECT * FROM c WHERE c.product_id = @product_id"
-            product_params = [{"name": "@product_id", "value": purchase_record["product_id"]}]
-            product_results = list(product_container.query_items(
-                query=product_query,
-                parameters=product_params,
-                enable_cross_partition_query=True
-            ))
-            if product_results:
-                # limit to first result and extract product details
-                product_details = {
-                    "name": product_results[0]["name"],
-                    "category": product_results[0]["category"],
-                    "type": product_results[0]["type"],
-                    "brand": product_results[0]["brand"],
-                    "company": product_results[0]["company"],
-                    "unit_price": product_results[0]["unit_price"],
-                    "weight": product_results[0]["weight"],
-                    "color": product_results[0].get("color", ""),
-                    "material": product_results[0].get("material", "")
-                }
-            else:
-                return f"Product with ID {purchase_record['product_id']} not found"
-        else:
+
+        if "product_id" not in purchase_record:
             return "Missing required field: product_id"
 
-        # Create final purchase record with required schema
+        # The customer-existence check and product lookup are independent
+        # point reads, so overlap them instead of awaiting sequentially
+        customer_result, product_result = await asyncio.gather(
+            _customer_container().read_item(item=self.customer_id, partition_key=self.customer_id),
+            _get_product(_product_container(), purchase_record["product_id"]),
+            return_exceptions=True,
+        )
+        if isinstance(customer_result, exceptions.CosmosResourceNotFoundError):
+            return f"Customer with ID {self.customer_id} not found"
+        if isinstance(customer_result, BaseException):
+            raise customer_result
+        if isinstance(product_result, exceptions.CosmosResourceNotFoundError):
+            return f"Product with ID {purchase_record['product_id']} not found"
+        if isinstance(product_result, BaseException):
+            raise product_result
+
+        product_details = {
+            "name": product_result["name"],
+            "category": product_result["category"],
+            "type": product_result["type"],
+            "brand": product_result["brand"],
+            "company": product_result["company"],
+            "unit_price": product_result["unit_price"],
+            "weight": product_result["weight"],
+            "color": product_result.get("color", ""),
+            "material": product_result.get("material", "")
+        }
+
+        # Create final purchase record with required schema; compute "now" once
+        # so purchasing_date and delivered_date stay consistent
+        now = datetime.now(timezone.utc)
         final_record = {
             "customer_id": self.customer_id,
             "product_id": purchase_record["product_id"],
             "quantity": purchase_record.get("quantity", 1),  # Default to 1 if not specified
-            "purchasing_date": datetime.now(timezone.utc).isoformat(),
+            "purchasing_date": now.isoformat(),
             # Default to current date + 5 days
-            "delivered_date": (datetime.now(timezone.utc) + timedelta(days=5)).isoformat(),
-            "order_number": str(uuid.uuid4().hex),
+            "delivered_date": (now + timedelta(days=5)).isoformat(),
+            "order_number": uuid.uuid4().hex,  # .hex is already a string
             "product_details": product_details,
             "total_price": product_details.get("unit_price", 0) * purchase_record.get("quantity", 1),
             "id": str(uuid.uuid4())
         }
         
+        # Submit the write as a transactional batch on the customer partition:
+        # it costs the same round trip as a bare create today, and any future
+        # same-partition writes (e.g. a customer spend aggregate) can join the
+        # batch atomically instead of adding round trips
         try:
-            container.create_item(body=final_record)
+            await _purchase_container().execute_item_batch(
+                [("create", (final_record,))],
+                partition_key=self.customer_id,
+            )
             return "Purchase record created successfully."
+        except exceptions.CosmosBatchOperationError as e:
+            failed = e.error_index
+            logging.error(f"Purchase batch failed at operation {failed}: {e}")
+            return f"Failed to create purchase record (batch operation {failed}): {str(e)}"
         except exceptions.CosmosHttpResponseError as e:
             logging.error(f"Failed to create purchase record: {e}")
             return f"Failed to create purchase record: {str(e)}"
@@ -147,17 +196,7 @@ class DatabasePlugin:
         phone_number: Annotated[str, "Customer's phone number"] = None
     ) -> Annotated[Dict, "Result of the customer record update."]:
         """Updates an existing customer record in the Customer container."""
-        container = database.get_container_client(customer_container_name)
 
-        # Query to find the customer document using customer_id
-        query = f"SELECT * FROM c WHERE c.customer_id = '{self.customer_id}'"
-        items = list(container.query_items(query=query, enable_cross_partition_query=True))
-        
-        if not items:
-            return {"status": "error", "message": "Customer record not found"}
-        
-        customer_doc = items[0]
-        
         # Create update data dictionary with only provided values
         update_data = {}
         if first_name:
@@ -170,42 +209,53 @@ class DatabasePlugin:
             update_data['address'] = address
         if phone_number:
             update_data['phone_number'] = phone_number
-            
-        # Update the document with allowed fields only
-        customer_doc.update(update_data)
-        
-        # Replace the item without explicitly passing the partition key
-        container.replace_item(
-            item=customer_doc,
-            body=customer_doc
-        )
-        
-        return {"status": "success", "message": "Customer record updated successfully"}
+
+        # Optimistic concurrency: replace only if the document is unchanged
+        # since our read (ETag match), otherwise re-read and re-apply the
+        # update so concurrent tool calls can't silently lose writes
+        for _ in range(3):
+            # Point read by customer_id: cheaper than a cross-partition query
+            # and avoids interpolating the id into the query text
+            try:
+                customer_doc = await _customer_container().read_item(item=self.customer_id, partition_key=self.customer_id)
+            except exceptions.CosmosResourceNotFoundError:
+                return {"status": "error", "message": "Customer record not found"}
+
+            # Update the document with allowed fields only
+            customer_doc.update(update_data)
+
+            # Replace the item by id; passing the id string is cheaper than
+            # passing the whole document as the item argument
+            try:
+                await _customer_container().replace_item(
+                    item=customer_doc["id"],
+                    body=customer_doc,
+                    etag=customer_doc["_etag"],
+                    match_condition=MatchConditions.IfNotModified,
+                )
+            except exceptions.CosmosAccessConditionFailedError:
+                continue
+            return {"status": "success", "message": "Customer record updated successfully"}
+
+        return {"status": "error", "message": "Customer record update conflicted; please retry"}
 
     @kernel_function(description="Retrieve the current customer's information.")
     async def get_customer_record(self) -> Annotated[Union[Dict, str], "The customer record or error message."]:
         """Retrieves the customer record from the Customer container."""
-        container = database.get_container_client(customer_container_name)
         try:
-            query = """SELECT 
-                c.customer_id,
-                c.first_name,
-                c.last_name,
-                c.email,
-                c.address,
-                c.phone_number
-            FROM c 
-            WHERE c.customer_id = @customer_id"""
-            
-            parameters = [{"name": "@customer_id", "value": self.customer_id}]
-            items = list(container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-            if not items:
+            # Point read by customer_id, projecting the public fields client-side
+            try:
+                customer = await _customer_container().read_item(item=self.customer_id, partition_key=self.customer_id)
+            except exceptions.CosmosResourceNotFoundError:
                 return f"No customer found with ID: {self.customer_id}"
-            return items[0]
+            return {
+                "customer_id": customer.get("customer_id"),
+                "first_name": customer.get("first_name"),
+                "last_name": customer.get("last_name"),
+                "email": customer.get("email"),
+                "address": customer.get("address"),
+                "phone_number": customer.get("phone_number")
+            }
         except exceptions.CosmosHttpResponseError as e:
             logging.error(f"Failed to get customer record: {e}")
             return f"Failed to get customer record: {str(e)}"
@@ -213,28 +263,38 @@ class DatabasePlugin:
     @kernel_function(description="Retrieve all products or a specific product from the catalog.")
     async def get_product_record(
         self,
-        product_id: Annotated[str, "Optional: The specific product ID to look up"] = None
+        product_id: Annotated[str, "Optional: The specific product ID to look up"] = None,
+        category: Annotated[str, "Optional: Filter the product list by category"] = None
     ) -> Annotated[Union[List[Dict], Dict, str], "Product record(s) or error message."]:
         """Retrieves product records from the Product container."""
-        container = database.get_container_client(product_container_name)
         try:
             if product_id:
-                query = """SELECT 
-                    c.product_id,
-                    c.name,
-                    c.category,
-                    c.type,
-                    c.brand,
-                    c.company,
-                    c.unit_price,
-                    c.weight
-                FROM c 
-                WHERE c.product_id = @product_id"""
-                query_parameters = [{"name": "@product_id", "value": product_id}]
-                items = list(container.query_items(query=query, parameters=query_parameters, enable_cross_partition_query=True))
-                return items[0] if items else f"No product found with ID: {product_id}"
+                # Point read by product_id, projecting the public fields client-side
+                try:
+                    product = await _get_product(_product_container(), product_id)
+                except exceptions.CosmosResourceNotFoundError:
+                    return f"No product found with ID: {product_id}"
+                return {
+                    "product_id": product.get("product_id"),
+                    "name": product.get("name"),
+                    "category": product.get("category"),
+                    "type": product.get("type"),
+                    "brand": product.get("brand"),
+                    "company": product.get("company"),
+                    "unit_price": product.get("unit_price"),
+                    "weight": product.get("weight")
+                }
             else:
-                items = list(container.read_all_items())
+                # Return a bounded, projected page instead of materializing the
+                # whole catalog into memory and into the LLM prompt
+                query = "SELECT TOP 50 c.product_id, c.name, c.category, c.brand, c.unit_price FROM c"
+                query_parameters = None
+                if category:
+                    query = """SELECT TOP 50 c.product_id, c.name, c.category, c.brand, c.unit_price
+                    FROM c
+                    WHERE c.category = @category"""
+                    query_parameters = [{"name": "@category", "value": category}]
+                items = await _query_to_list(_product_container(), query, query_parameters)
                 return items if items else "No products found."
         except exceptions.CosmosHttpResponseError as e:
             logging.error(f"Failed to get product record(s): {e}")
@@ -243,14 +303,9 @@ class DatabasePlugin:
     @kernel_function(description="Retrieve all purchases for the current customer.")
     async def get_purchases_record(self) -> Annotated[Union[List[Dict], str], "Purchase records or error message."]:
         """Retrieves all purchase records for the current customer with product details."""
-        purchases_container = database.get_container_client(purchase_container_name)
-        product_container = database.get_container_client(product_container_name)
-        
-        # Validate customer exists
-        customer_container = database.get_container_client(customer_container_name)
-        if not self.validate_customer_exists(customer_container):
-            return f"Customer with ID {self.customer_id} not found"
-        
+
+        # No separate existence check: the purchases query below already
+        # filters by customer_id and returns nothing for unknown customers
         try:
             # First get all purchases for the customer
             query = """SELECT 
@@ -265,37 +320,35 @@ class DatabasePlugin:
             WHERE c.customer_id = @customer_id"""
             
             parameters = [{"name": "@customer_id", "value": self.customer_id}]
-            purchases = list(purchases_container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            purchases = await _query_to_list(
+                _purchase_container(), query, parameters, partition_key=self.customer_id
+            )
 
             if not purchases:
                 return f"No purchases found for customer: {self.customer_id}"
 
+            # Fetch the details for all referenced products in one query instead
+            # of one round trip per purchase
+            product_ids = list({purchase["product_id"] for purchase in purchases})
+            product_query = """SELECT
+                c.product_id,
+                c.name,
+                c.category,
+                c.type,
+                c.brand,
+                c.company,
+                c.unit_price,
+                c.weight
+            FROM c
+            WHERE ARRAY_CONTAINS(@product_ids, c.product_id)"""
+            product_params = [{"name": "@product_ids", "value": product_ids}]
+            products = await _query_to_list(_product_container(), product_query, product_params)
+            products_by_id = {product["product_id"]: product for product in products}
+
             # Enhance purchase records with product details
             enhanced_purchases = []
             for purchase in purchases:
-                # Get product details
-                product_query = """SELECT 
-                    c.name,
-                    c.category,
-                    c.type,
-                    c.brand,
-                    c.company,
-                    c.unit_price,
-                    c.weight
-                FROM c 
-                WHERE c.product_id = @product_id"""
-                product_params = [{"name": "@product_id", "value": purchase["product_id"]}]
-                
-                product = list(product_container.query_items(
-                    query=product_query,
-                    parameters=product_params,
-                    enable_cross_partition_query=True
-                ))
-
+                product = products_by_id.get(purchase["product_id"])
                 if product:
                     # Create clean purchase record without technical fields
                     clean_purchase = {
@@ -304,16 +357,15 @@ class DatabasePlugin:
                         "delivery_date": purchase["delivered_date"],
                         "total_price": purchase["total_price"],
                         "product": {
-                            "name": product[0]["name"],
-                            "category": product[0]["category"],
-                            "type": product[0]["type"],
-                            "brand": product[0]["brand"],
-                            "company": product[0]["company"],
-                            "price": product[0]["unit_price"],
-                            "weight": product[0]["weight"]
+                            "name": product["name"],
+                            "category": product["category"],
+                            "type": product["type"],
+                            "brand": product["brand"],
+                            "company": product["company"],
+                            "price": product["unit_price"],
+                            "weight": product["weight"]
                         }
                     }
-                    enhanced_purchases.append(clean_purchase)
                 else:
                     # Include purchase with minimal technical details if product not found
                     clean_purchase = {
@@ -323,7 +375,7 @@ class DatabasePlugin:
                         "total_price": purchase["total_price"],
                         "product": {"error": "Product details not found"}
                     }
-                    enhanced_purchases.append(clean_purchase)
+                enhanced_purchases.append(clean_purchase)
 
             return enhanced_purchases
 
@@ -331,11 +383,55 @@ class DatabasePlugin:
             logging.error(f"Failed to get purchase records: {e}")
             return f"Failed to get purchase records: {str(e)}"
 
+# Agent instructions as a module constant so the string is built once per
+# process. The per-operation list was dropped: Semantic Kernel already sends
+# each function's schema to the model, so repeating it only costs tokens.
+DATABASE_AGENT_INSTRUCTIONS = """
+You are a database assistant that manages records in CosmosDB with specific operations for each container type. Use the provided functions to perform database operations.
+Interaction goes over voice, so it's *super* important that answers are as short as possible. Use professional language.
+
+NOTES:
+- Before updating or creating any records, make sure to confirm the details with the user.
+- All operations automatically use the current customer's ID.
+- Purchases are always associated with both the current customer and a product_id.
+- Before creating or updating a record, use the 'get' functions to retrieve the required schema of the respective container.
+
+IMPORTANT: Never invent new tool or function names. Always use only the provided functions when interacting with the database.
+"""
+
 # Sample user queries for demonstration
 USER_INPUTS = [
     "Show me my profile information, my customer ID is b63d3f5bbaa7395caf90cdfddb2bc54f"
 ]
 
+# Cap on concurrent scripted turns so the warmup fan-out can't throttle the endpoint
+_TURN_SEMAPHORE = asyncio.Semaphore(4)
+
+
+async def _run_turn(agent, user_input):
+    """Runs one scripted input on its own ChatHistory and prints the responses."""
+    async with _TURN_SEMAPHORE:
+        chat_history = ChatHistory()
+        chat_history.add_user_message(user_input)
+        print(f"# User: {user_input}")
+
+        # Emit the agent prefix once per turn and buffer content through
+        # sys.stdout so the loop isn't blocked by a flush per streamed chunk
+        printed_prefix = False
+        async for content in agent.invoke(chat_history):
+            if (
+                not any(isinstance(item, (FunctionCallContent, FunctionResultContent)) for item in content.items)
+                and content.content.strip()
+            ):
+                # We only want to print the content if it's not a function call or result
+                if not printed_prefix:
+                    sys.stdout.write(f"# {content.name}: ")
+                    printed_prefix = True
+                sys.stdout.write(content.content)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+
 async def main():
     customer_id = "customer123"  # Example customer ID - in production, this would be dynamically set
     
@@ -361,50 +457,19 @@ async def main():
     agent = ChatCompletionAgent(
         kernel=kernel,
         name="Database_Agent",
-        instructions="""
-You are a database assistant that manages records in CosmosDB with specific operations for each container type. Use the provided functions to perform database operations.
-Interaction goes over voice, so it's *super* important that answers are as short as possible. Use professional language.
-
-Available operations:
-- create_purchases_record: creates a new purchase record in the Purchases container.
-- update_customer_record: updates the existing customer record in the Customer container.
-- get_customer_record: retrieves the customer's information from the Customer container.
-- get_product_record: retrieves all available products or a specific product from the Product container.
-- get_purchases_record: retrieves all purchases for the current customer from the Purchases container.
-
-NOTES:
-- Before updating or creating any records, make sure to confirm the details with the user.
-- All operations automatically use the current customer's ID.
-- Purchases are always associated with both the current customer and a product_id.
-- Before creating or updating a record, use the 'get' functions to retrieve the required schema of the respective container.
-
-IMPORTANT: Never invent new tool or function names. Always use only the provided functions when interacting with the database.
-        """,
+        instructions=DATABASE_AGENT_INSTRUCTIONS,
         arguments=KernelArguments(settings=settings),
     )
 
-    # 4. Create a chat history to hold the conversation
+    # 4. Create a chat history to hold the interactive conversation
     chat_history = ChatHistory()
 
     # Interactive conversation loop
     print(f"Starting conversation with Database Agent (Customer ID: {customer_id})")
-    
-    for user_input in USER_INPUTS:
-        # 5. Add the user input to the chat history
-        chat_history.add_user_message(user_input)
-        print(f"# User: {user_input}")
-        
-        # 6. Invoke the agent for a response
-        async for content in agent.invoke(chat_history):
-            print(f"# {content.name}: ", end="")
-            if (
-                not any(isinstance(item, (FunctionCallContent, FunctionResultContent)) for item in content.items)
-                and content.content.strip()
-            ):
-                # We only want to print the content if it's not a function call or result
-                print(f"{content.content}", end="", flush=True)
-        print("")
-        
+
+    # 5. Run the independent scripted inputs concurrently, each on its own history
+    await asyncio.gather(*(_run_turn(agent, user_input) for user_input in USER_INPUTS))
+
     # After predetermined inputs, switch to interactive mode
     print("\nSwitching to interactive mode. Type 'exit' to end the conversation.")
     while True:
@@ -414,14 +479,26 @@ IMPORTANT: Never invent new tool or function names. Always use only the provided
             
         chat_history.add_user_message(user_input)
         
+        printed_prefix = False
         async for content in agent.invoke(chat_history):
-            print(f"{content.name}: ", end="")
             if (
                 not any(isinstance(item, (FunctionCallContent, FunctionResultContent)) for item in content.items)
                 and content.content.strip()
             ):
-                print(f"{content.content}", end="", flush=True)
-        print("")
+                if not printed_prefix:
+                    sys.stdout.write(f"{content.name}: ")
+                    printed_prefix = True
+                sys.stdout.write(content.content)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+async def _run():
+    try:
+        await main()
+    finally:
+        # Close the shared Cosmos client and credential on shutdown
+        await close_clients()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(_run())
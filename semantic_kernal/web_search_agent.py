@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 from azure.cosmos import CosmosClient, exceptions
 from azure.identity import DefaultAzureCredential
 import logging
+import time
+import orjson
+from functools import lru_cache
 
 # Get the absolute path to the .env file in the semantic_kernal folder
 current_dir = Path(__file__).parent
@@ -26,35 +29,136 @@ from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.contents import ChatHistory, FunctionCallContent, FunctionResultContent
 from semantic_kernel.functions import KernelArguments, kernel_function
 
+# The async Cosmos container proxy comes from the shared _clients singletons,
+# so cache-miss lookups inside the async tool don't block the event loop the
+# way the synchronous SDK does
+from _clients import container as get_async_container, aclose as close_clients
+
 # Bing Search Configuration
 bing_api_key = os.getenv("BING_SEARCH_API_KEY")
 has_bing_api_key = bing_api_key is not None and bing_api_key != ''
 bing_api_endpoint = os.getenv("BING_SEARCH_API_ENDPOINT", "https://api.bing.microsoft.com/v7.0/search")
 
-# CosmosDB Configuration
-credential = DefaultAzureCredential()
+# Shared aiohttp session, created lazily on the running loop so keep-alive
+# connections and cached DNS are reused across search_web calls instead of
+# paying a TCP+TLS handshake per query
+_session: Optional[aiohttp.ClientSession] = None
+_session_lock = asyncio.Lock()
+
+# Cap concurrent Bing requests so parallel tool invocations can't trip the
+# API's rate limits
+_SEARCH_SEMAPHORE = asyncio.Semaphore(10)
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """Returns the shared ClientSession, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        async with _session_lock:
+            if _session is None or _session.closed:
+                _session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=32,
+                        limit_per_host=10,
+                        ttl_dns_cache=300,
+                        enable_cleanup_closed=True,
+                    ),
+                    # A hung endpoint should fail the tool call, not wedge
+                    # the whole agent loop
+                    timeout=aiohttp.ClientTimeout(total=8, connect=2),
+                )
+    return _session
+
+
+async def _close_session() -> None:
+    """Closes the shared ClientSession if it was ever created."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+# CosmosDB Configuration: clients are lazy singletons so importing this module
+# costs nothing — token acquisition and the database existence check happen
+# once, on first use, instead of at import
 cosmos_endpoint = os.getenv("COSMOSDB_ENDPOINT")
-cosmos_client = CosmosClient(cosmos_endpoint, credential)
 database_name = os.getenv("COSMOSDB_DATABASE")
-database = cosmos_client.create_database_if_not_exists(id=database_name)
 product_container_name = "Product"
-producturl_container = database.get_container_client(os.getenv("COSMOSDB_ProductUrl_CONTAINER"))
+
+
+@lru_cache(maxsize=1)
+def _credential() -> DefaultAzureCredential:
+    return DefaultAzureCredential()
+
+
+@lru_cache(maxsize=1)
+def _cosmos_client() -> CosmosClient:
+    return CosmosClient(cosmos_endpoint, _credential())
+
+
+@lru_cache(maxsize=1)
+def _database():
+    return _cosmos_client().create_database_if_not_exists(id=database_name)
+
+
+# Company name and restricted-URL suffix change on human timescales, so both
+# are memoized with a TTL instead of hitting Cosmos on every call
+_LOOKUP_CACHE_TTL = 300  # seconds
+_target_company_cache: Optional[tuple] = None  # (expires_at, value)
+_restricted_suffix_cache: Optional[tuple] = None  # (expires_at, value)
+_restricted_suffix_lock = asyncio.Lock()
+
 
 def get_target_company():
     # use the first item in the Product container and get the value of the field "company"
-    database = cosmos_client.get_database_client(database_name)
-    container = database.get_container_client(product_container_name)
+    global _target_company_cache
+    if _target_company_cache and time.monotonic() < _target_company_cache[0]:
+        return _target_company_cache[1]
+    container = _database().get_container_client(product_container_name)
     try:
-        # Query the container for the first item
-        items = list(container.read_all_items())
-        if items:
-            return items[0]["company"]
-        else:
-            return None
+        # Project just the company of one document rather than materializing
+        # the whole container with read_all_items
+        items = list(container.query_items(
+            query="SELECT TOP 1 c.company FROM c",
+            enable_cross_partition_query=True
+        ))
+        company = items[0]["company"] if items else None
+        _target_company_cache = (time.monotonic() + _LOOKUP_CACHE_TTL, company)
+        return company
     except exceptions.CosmosResourceNotFoundError as e:
         logging.error(f"CosmosHttpResponseError: {e}")
         return None
 
+
+async def _restricted_url_suffix() -> str:
+    """Returns the precomputed 'site:... OR site:...' query suffix, cached with a TTL."""
+    global _restricted_suffix_cache
+    if _restricted_suffix_cache and time.monotonic() < _restricted_suffix_cache[0]:
+        return _restricted_suffix_cache[1]
+    async with _restricted_suffix_lock:
+        if _restricted_suffix_cache and time.monotonic() < _restricted_suffix_cache[0]:
+            return _restricted_suffix_cache[1]
+        suffix = ""
+        try:
+            # Project only the urls array of the single ProductUrl document
+            producturl_container = get_async_container(os.getenv("COSMOSDB_ProductUrl_CONTAINER"))
+            items = [
+                item
+                async for item in producturl_container.query_items(
+                    query="SELECT TOP 1 c.urls FROM c",
+                    max_item_count=1,
+                )
+            ]
+            if items:
+                restricted_urls = items[0].get('urls', [])
+                if restricted_urls:
+                    suffix = " OR ".join(
+                        f"site:{url.removeprefix('https://').removeprefix('http://')}" for url in restricted_urls
+                    )
+        except Exception as ex:
+            logging.error(f"Error querying ProductUrl container: {ex}")
+        _restricted_suffix_cache = (time.monotonic() + _LOOKUP_CACHE_TTL, suffix)
+        return suffix
+
 class WebSearchPlugin:
     """A plugin for searching the web using Bing."""
     
@@ -67,32 +171,31 @@ class WebSearchPlugin:
         if not has_bing_api_key:
             return "Web search is currently unavailable because no Bing Search API key was provided."
         
-        try:
-            # Retrieve the single ProductUrl document from CosmosDB
-            items = list(producturl_container.query_items(
-                query="SELECT * FROM c",
-                enable_cross_partition_query=True
-            ))
-            if items:
-                restricted_urls = items[0].get('urls', [])
-                if restricted_urls:
-                    concatenated_url_string = " OR ".join(
-                        f"site:{url.replace('https://','').replace('http://','')}" for url in restricted_urls
-                    )
-                    query = f"{query} {concatenated_url_string}"
-        except Exception as ex:
-            logging.error(f"Error querying ProductUrl container: {ex}")
+        # Constrain the query to the cached restricted-URL list, if any
+        concatenated_url_string = await _restricted_url_suffix()
+        if concatenated_url_string:
+            query = f"{query} {concatenated_url_string}"
 
         headers = {"Ocp-Apim-Subscription-Key": bing_api_key}
-        params = {"q": query, "count": 3}
+        # Only webPages name/snippet/url are consumed, so ask Bing for just
+        # that: responseFilter drops the other answer types and raw text skips
+        # the decoration markup, cutting bytes on the wire and parse time
+        params = {
+            "q": query,
+            "count": 3,
+            "responseFilter": "Webpages",
+            "textDecorations": "false",
+            "textFormat": "Raw",
+        }
         url = bing_api_endpoint
         if up_to_date:
             params.update({"sortby": "Date"})
         try:
-            async with aiohttp.ClientSession() as session:
+            session = await _get_session()
+            async with _SEARCH_SEMAPHORE:
                 async with session.get(url, headers=headers, params=params) as response:
                     response.raise_for_status()
-                    search_results = await response.json()
+                    search_results = orjson.loads(await response.read())
                     results = []
                     if search_results and "webPages" in search_results and "value" in search_results["webPages"]:
                         for v in search_results["webPages"]["value"]:
@@ -103,13 +206,26 @@ class WebSearchPlugin:
                             }
                             results.append(result)
                     formatted_result = "\n".join([
-                        f'{i}. content: {item["content"]}, source_title: {item["source_title"]}, source_url: {item["source_url"]}' 
+                        f'{i}. content: {item["content"]}, source_title: {item["source_title"]}, source_url: {item["source_url"]}'
                         for i, item in enumerate(results, 1)
                     ])
                     return formatted_result
         except Exception as ex:
             return f"Error during web search: {str(ex)}"
 
+# Agent instructions template as a module constant, formatted once per run
+# with the target company
+WEB_SEARCH_AGENT_INSTRUCTIONS_TMPL = """
+You are a web search agent that queries Bing search engine to retrieve up-to-date information from the Internet.
+If user is asking about any related products or services from {target_company}'s competitors or from the same industry, you promote {target_company}'s equivalent products by directing to search the same category across {target_company}'s portfolio.
+
+Your tasks are:
+- Use the 'search_web' function to look up the web to find the solution to the user's issue directly, or search web to help as part of the whole solution.
+- Act politely and professionally. If the source is a famous and credible website, you can mention it to the user e.g. 'according to <source>'.
+
+Interaction goes over voice, so it's *super* important that answers are as short as possible.
+"""
+
 # Sample user queries for demonstration
 USER_INPUTS = [
     "what are some of the latest news about Unilever?",
@@ -140,22 +256,21 @@ async def main():
     agent = ChatCompletionAgent(
         kernel=kernel,
         name="Web_Search_Agent",
-        instructions=f"""
-        You are a web search agent that queries Bing search engine to retrieve up-to-date information from the Internet.
-        If user is asking about any related products or services from {target_company}'s competitors or from the same industry, you promote {target_company}'s equivalent products by directing to search the same category across {target_company}'s portfolio.
-        
-        Your tasks are:
-        - Use the 'search_web' function to look up the web to find the solution to the user's issue directly, or search web to help as part of the whole solution.
-        - Act politely and professionally. If the source is a famous and credible website, you can mention it to the user e.g. 'according to <source>'.
-        
-        Interaction goes over voice, so it's *super* important that answers are as short as possible.
-        """,
+        instructions=WEB_SEARCH_AGENT_INSTRUCTIONS_TMPL.format(target_company=target_company),
         arguments=KernelArguments(settings=settings),
     )
 
     # 4. Create a chat history to hold the conversation
     chat_history = ChatHistory()
 
+    try:
+        await _chat_loop(agent, chat_history)
+    finally:
+        # Release the shared HTTP session and Cosmos client pools on exit
+        await asyncio.gather(_close_session(), close_clients())
+
+
+async def _chat_loop(agent, chat_history):
     for user_input in USER_INPUTS:
         # 5. Add the user input to the chat history
         chat_history.add_user_message(user_input)
@@ -191,4 +306,10 @@ async def main():
         print("")
 
 if __name__ == "__main__":
+    # Use uvloop's libuv-based event loop when available for faster socket I/O
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
\ No newline at end of file
@@ -3,50 +3,98 @@ import streamlit as st
 import re
 import shutil
 from azure.ai.projects import AIProjectClient
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.inference import ChatCompletionsClient
-from azure.ai.projects.models import CodeInterpreterTool, BingGroundingTool, ToolSet
+from common.clients import get_aoai_client
+from common.titles import cached_title
+from azure.ai.projects.models import (
+    CodeInterpreterTool,
+    BingGroundingTool,
+    MessageDeltaChunk,
+    RunStep,
+    ThreadMessage,
+    ThreadRun,
+    ToolSet,
+)
 from azure.identity import DefaultAzureCredential
 from typing import Any
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
-import json
+import orjson
 import uuid
 
 # Load environment variables from .env file
 load_dotenv()
-conn_str = os.environ["PROJECT_CONNECTION_STRING"]
-project_client = AIProjectClient.from_connection_string(
-    credential=DefaultAzureCredential(), 
-    conn_str=conn_str
-)
-# instantiate Azure OpenAI client
-AOAI_client = ChatCompletionsClient(
-    endpoint=os.environ["AOAI_ENDPOINT"],  # Of the form https://<your-resouce-name>.openai.azure.com/openai/deployments/<your-deployment-name>
-    credential=AzureKeyCredential(os.environ["AOAI_KEY"]),
-    api_version="2024-10-21",  # Azure OpenAI api-version. See https://aka.ms/azsdk/azure-ai-inference/azure-openai-api-versions
-)
+
+# Clients are lazy singletons: Streamlit re-imports this script on every rerun,
+# so building them at import would redo token acquisition each time. The
+# factories below construct each client once per process, on first use.
+
+
+@st.cache_resource
+def get_credential():
+    return DefaultAzureCredential()
+
+
+@st.cache_resource
+def get_project_client():
+    return AIProjectClient.from_connection_string(
+        credential=get_credential(),
+        conn_str=os.environ["PROJECT_CONNECTION_STRING"]
+    )
+
+
+# The Bing connection and an existing agent handle never change for a given
+# id, so both are cached to keep repeat turns from re-fetching them over REST
+@st.cache_resource
+def get_bing_connection():
+    return get_project_client().connections.get(connection_name=os.environ["BING_CONNECTION_NAME"])
+
+
+@st.cache_resource
+def get_agent(agent_id):
+    return get_project_client().agents.get_agent(agent_id)
+
+
+# The Azure OpenAI inference client is shared with the other Streamlit apps
 # function to clear chat history
 def clear_chat_history():
     """Clears all chat history and resets session states."""
     if st.session_state.agent_id:
-        project_client.agents.delete_agent(st.session_state.agent_id)
+        get_project_client().agents.delete_agent(st.session_state.agent_id)
         st.session_state.agent_id = None
     if st.session_state.thread_id:
-        project_client.agents.delete_thread(st.session_state.thread_id)
+        get_project_client().agents.delete_thread(st.session_state.thread_id)
         st.session_state.thread_id = None
     st.session_state.messages = []
+    # Compact the persisted history to an empty session: without this the
+    # append log and the previously compacted messages would resurrect the
+    # cleared conversation on the next load_session
+    _message_log_path(st.session_state.session_id).unlink(missing_ok=True)
+    _writer_exec.submit(
+        _atomic_write,
+        agent_conversations_path / f"{st.session_state.session_id}.json",
+        orjson.dumps({
+            "agent_id": None,
+            "thread_id": None,
+            "messages": [],
+            "title": None,
+            "titled_len": None,
+        }),
+    )
     st.rerun()
 # Prepare markdown for the image (assumes one image)
+_IMG_RE = re.compile(r"!\[(.*?)\]\((.*?)\)")
+
 def st_markdown(markdown_string):
     """
     Custom markdown function to handle images and escape {}.
     """
-    
-    parts = re.split(
-        r"!\[(.*?)\]\((.*?)\)", 
-        markdown_string
-    )
+    # Most messages carry no image; a substring check is far cheaper than
+    # running the regex split over every history entry on each rerun
+    if "![" not in markdown_string:
+        st.markdown(markdown_string)
+        return
+    parts = _IMG_RE.split(markdown_string)
     for i, part in enumerate(parts):
         if i % 3 == 0:
             st.markdown(part)
@@ -58,10 +106,34 @@ st.title("Azure AI Agent Service Chat")
 agent_conversations_path = Path("agent_conversations").resolve()
 agent_conversations_path.mkdir(exist_ok=True)
 
+# New messages go to a per-session append-only .jsonl log, so a turn costs one
+# small append instead of re-serializing the whole history; the log is folded
+# back into the .json file once it grows past this many entries
+_COMPACT_LOG_EVERY = 50
+
+# Session metadata writes happen off the render thread: a one-worker executor
+# keeps writes ordered, and the tmp-file + os.replace dance keeps each file
+# whole even if the process dies mid-write
+_writer_exec = ThreadPoolExecutor(max_workers=1)
+
+
+def _atomic_write(path, payload):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, path)
+
+
+def _message_log_path(session_id):
+    return agent_conversations_path / f"{session_id}.jsonl"
+
+def append_message(session_id, message):
+    with open(_message_log_path(session_id), "ab") as log_file:
+        log_file.write(orjson.dumps(message) + b"\n")
+
 def load_session(session_id):
     file_path = agent_conversations_path / f"{session_id}.json"
     if file_path.exists():
-        data = json.loads(file_path.read_text())
+        data = orjson.loads(file_path.read_bytes())
         st.session_state.agent_id = data.get("agent_id", None)
         st.session_state.thread_id = data.get("thread_id", None)
         st.session_state.messages = data.get("messages", [])
@@ -69,15 +141,38 @@ def load_session(session_id):
         st.session_state.agent_id = None
         st.session_state.thread_id = None
         st.session_state.messages = []
+    log_path = _message_log_path(session_id)
+    if log_path.exists():
+        st.session_state.messages.extend(
+            orjson.loads(line) for line in log_path.read_bytes().splitlines() if line
+        )
 
 def save_session(session_id):
+    """Writes session metadata; messages are persisted through append_message."""
     file_path = agent_conversations_path / f"{session_id}.json"
+    log_path = _message_log_path(session_id)
+    messages = st.session_state.messages
+    # Titles are a function of the messages, so compute them once here when
+    # the conversation actually grew instead of on every sidebar render
+    title, titled_len, compacted = None, None, []
+    if file_path.exists():
+        previous = orjson.loads(file_path.read_bytes())
+        title, titled_len = previous.get("title"), previous.get("titled_len")
+        compacted = previous.get("messages", [])
+    if messages and len(messages) != titled_len:
+        title = summarize_conversation(messages)
+        titled_len = len(messages)
+    if log_path.exists() and len(messages) - len(compacted) >= _COMPACT_LOG_EVERY:
+        compacted = messages
+        log_path.unlink()
     data = {
         "agent_id": st.session_state.agent_id,
         "thread_id": st.session_state.thread_id,
-        "messages": st.session_state.messages
+        "messages": compacted,
+        "title": title,
+        "titled_len": titled_len,
     }
-    file_path.write_text(json.dumps(data), encoding="utf-8")
+    _writer_exec.submit(_atomic_write, file_path, orjson.dumps(data))
 
 # use Azure OpenAI gpt-4o-mini to summarize the conversation 
 # into a short sentence of no more than 6 words
@@ -87,12 +182,24 @@ def summarize_conversation(messages):
     Do not include any other commentary or description."""
     formatted_messages = [{"role": "user", "content": m["content"]} for m in messages if m["role"] == "user"]
     formatted_messages.append({"role": "user", "content": prompt})
-    response = AOAI_client.complete(
+    response = get_aoai_client().complete(
         messages=formatted_messages, 
         max_tokens=64, 
         temperature=0)
     return response.choices[0].message.content.strip()
 
+
+# st.cache_data needs a hashable argument, so the cached variant keys on the
+# tuple of user messages; repeat sidebars then cost zero LLM calls
+@st.cache_data(ttl=3600, show_spinner=False)
+def summarize_conversation_cached(user_messages: tuple):
+    # The persistent hash-keyed cache means identical conversation prefixes
+    # share one summary, even across restarts and across the Streamlit apps
+    return cached_title(
+        user_messages,
+        lambda msgs: summarize_conversation([{"role": "user", "content": m} for m in msgs]),
+    )
+
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
     
@@ -107,7 +214,7 @@ if "thread_id" not in st.session_state:
 
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
-        st.markdown(st_markdown(message["content"]))  # call st_markdown() for images
+        st_markdown(message["content"])  # st_markdown renders directly and returns None
 
 with st.sidebar:
     st.subheader("Agent Settings")
@@ -122,15 +229,40 @@ with st.sidebar:
 
     st.write("Available Sessions:")
     sorted_files = sorted(agent_conversations_path.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True) # sort by last modified time
+    # Parse with orjson, and only when a file's mtime changed since the last
+    # rerun; steady-state sidebar work is then a handful of stat() calls
+    if "_sidebar_cache" not in st.session_state:
+        st.session_state._sidebar_cache = {}
+    sessions = []
     for conv_file in sorted_files:
+        mtime = conv_file.stat().st_mtime
+        cached = st.session_state._sidebar_cache.get(conv_file.stem)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, orjson.loads(conv_file.read_bytes()))
+            st.session_state._sidebar_cache[conv_file.stem] = cached
+        sessions.append((conv_file, cached[1]))
+    # Titles are persisted by save_session; only legacy files without one need
+    # a summary, and those independent LLM round-trips fan out across a pool
+    untitled = [data for _, data in sessions if not data.get("title")]
+    if untitled:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            backfilled = pool.map(
+                lambda data: summarize_conversation_cached(tuple(
+                    m["content"] for m in data.get("messages", []) if m["role"] == "user"
+                )),
+                untitled,
+            )
+            for data, title in zip(untitled, backfilled):
+                data["title"] = title
+    for conv_file, session_data in sessions:
         sid = conv_file.stem
-        session_data = json.loads(conv_file.read_text())
-        short_summary = summarize_conversation(session_data.get("messages", []))
+        short_summary = session_data.get("title") or sid
         cols = st.columns([3,1])
         if cols[0].button(short_summary, key=f"switch_{sid}"):
             load_session(sid)
         if cols[1].button("delete", key=f"delete_{sid}"):
             conv_file.unlink(missing_ok=True)
+            _message_log_path(sid).unlink(missing_ok=True)
             session_folder = agent_conversations_path / sid
             if session_folder.exists() and session_folder.is_dir():
                 shutil.rmtree(session_folder)
@@ -146,36 +278,30 @@ with st.sidebar:
 
 if user_query := st.chat_input("Ask the agent something:"):
     st.session_state.messages.append({"role": "user", "content": user_query})
+    append_message(st.session_state.session_id, {"role": "user", "content": user_query})
     with st.chat_message("user"):
         st.markdown(user_query)
     
-    progress_indicator = st.progress(0)
-    st.session_state.progress = 0
-    
-    with project_client:
+    # One st.status block replaces the old four-step progress bar: setup
+    # renders as a single batched frame instead of a websocket message per
+    # increment, and there is no racy progress counter in session state
+    with st.status("Contacting agent...", expanded=False) as status:
         if st.session_state.thread_id is None:
-            thread = project_client.agents.create_thread()
+            thread = get_project_client().agents.create_thread()
             st.session_state.thread_id = thread.id
-            st.session_state.progress += 25
-            progress_indicator.progress(st.session_state.progress, "creating new thread...")
         else:
-            thread = project_client.agents.get_thread(st.session_state.thread_id)
-            st.session_state.progress += 25
-            progress_indicator.progress(st.session_state.progress, "thinking...")
+            thread = get_project_client().agents.get_thread(st.session_state.thread_id)
 
-        bing_connection = project_client.connections.get(connection_name=os.environ["BING_CONNECTION_NAME"])
-        bing = BingGroundingTool(connection_id=bing_connection.id)
         code_interpreter = CodeInterpreterTool()
         toolset = ToolSet()
         if "BingGrounding" in selected_tools:
-            toolset.add(bing)
+            # Resolve the connection only when the tool is actually selected
+            toolset.add(BingGroundingTool(connection_id=get_bing_connection().id))
         if "CodeInterpreter" in selected_tools:
             toolset.add(code_interpreter)
-        st.session_state.progress += 25
-        progress_indicator.progress(st.session_state.progress, "adding tools...")
 
         if st.session_state.agent_id is None:
-            agent = project_client.agents.create_agent(
+            agent = get_project_client().agents.create_agent(
                 model="gpt-4o",
                 name="my-agent",
                 instructions=instructions,
@@ -183,87 +309,110 @@ if user_query := st.chat_input("Ask the agent something:"):
                 toolset=toolset,
             )
             st.session_state.agent_id = agent.id
-            st.session_state.progress += 25
-            progress_indicator.progress(st.session_state.progress, "initializing new agent...")
         else:
-            agent = project_client.agents.get_agent(st.session_state.agent_id)
+            agent = get_agent(st.session_state.agent_id)
 
-        message = project_client.agents.create_message(
+        message = get_project_client().agents.create_message(
             thread_id=thread.id,
             role="user",
             content=user_query,
         )
-        run = project_client.agents.create_and_process_run(
-            thread_id=thread.id, 
+        status.update(label="Agent is responding...", state="complete")
+    # Stream the run instead of polling create_and_process_run: tokens
+    # render as they arrive, and the terminal message event carries the
+    # final text and annotations so no list_messages round-trip is needed
+    stream_state = {"run": None, "message": None, "python_code": None}
+
+    def stream_agent_tokens():
+        with get_project_client().agents.create_stream(
+            thread_id=thread.id,
             assistant_id=agent.id,
             max_prompt_tokens=max_prompt_tokens,
             max_completion_tokens=max_completion_tokens,
-        )
-        if run.status == "failed":
-            agent_response = f"Run failed: {run.last_error}"
+        ) as stream:
+            for event_type, event_data, _ in stream:
+                if isinstance(event_data, MessageDeltaChunk):
+                    yield event_data.text
+                elif isinstance(event_data, ThreadMessage) and event_data.status == "completed":
+                    stream_state["message"] = event_data
+                elif isinstance(event_data, ThreadRun):
+                    stream_state["run"] = event_data
+                elif isinstance(event_data, RunStep):
+                    # Completed tool-call steps already carry the code
+                    # interpreter input, so no list_run_steps round-trip is
+                    # needed after the run
+                    details = getattr(event_data, "step_details", None)
+                    if getattr(details, "type", None) == "tool_calls":
+                        for call in details.tool_calls:
+                            code_input = getattr(getattr(call, "code_interpreter", None), "input", None)
+                            if code_input:
+                                stream_state["python_code"] = code_input
+
+    with st.chat_message("assistant"):
+        st.write_stream(stream_agent_tokens)
+
+    run = stream_state["run"]
+    last_msg = stream_state["message"]
+    if run is not None and run.status == "failed":
+        agent_response = f"Run failed: {run.last_error}"
+    else:
+        if last_msg:
+            text_contents = [c for c in last_msg.content if getattr(c, "type", None) == "text"]
+            image_file_ids = [
+                c.image_file.file_id for c in last_msg.content
+                if getattr(c, "type", None) == "image_file"
+            ]
+            annotations = [a for c in text_contents for a in (c.text.annotations or [])]
+            agent_response = "".join(c.text.value for c in text_contents)
+            if "BingGrounding" in selected_tools and annotations:
+                citations = [
+                    f"- {annotation.text}: {url}"
+                    for annotation in annotations
+                    if (url := annotation.get("url_citation", {}).get("url"))
+                ]
+                if citations:
+                    agent_response += "\n\n### Citations:\n" + "\n".join(citations)
+            images_found = False
+            python_code = None
+            image_md = ""
+            if "CodeInterpreter" in selected_tools:
+                if image_file_ids:
+                    images_found = True
+                    images_dir = agent_conversations_path / st.session_state.session_id / "images"
+                    images_dir.mkdir(parents=True, exist_ok=True)
+
+                    def _save_image(file_id):
+                        file_name = images_dir / f"code_interpreter_result_{uuid.uuid4().hex[:8]}.png"
+                        get_project_client().agents.save_file(
+                            file_id=file_id,
+                            file_name=file_name.name,  # use only the filename
+                            target_dir=str(file_name.parent.resolve())  # specify target folder
+                        )
+                        return file_name
+
+                    # The saves are independent HTTP downloads, so run them
+                    # concurrently instead of one at a time
+                    with ThreadPoolExecutor(max_workers=4) as pool:
+                        saved_files = list(pool.map(_save_image, image_file_ids))
+                    image_md = "\n\n".join(f"![image]({f.as_posix()})" for f in saved_files)
+                # The code-interpreter input was collected from the run-step
+                # events while streaming
+                python_code = stream_state["python_code"]
+            # Combine responses in one message.
+            combined_response = agent_response
+            if images_found:
+                combined_response += "\n\n" + image_md
+            if python_code:
+                combined_response += "\n\n**Used Python Code Snippet:**\n```python\n" + python_code + "\n```"
+                #print(combined_response)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": combined_response
+            })
+            append_message(st.session_state.session_id, {"role": "assistant", "content": combined_response})
+            # The streamed text is already on screen; the rerun below
+            # re-renders the full combined response from history
         else:
-            messages = project_client.agents.list_messages(thread_id=thread.id)
-            last_msg = messages.get_last_text_message_by_role("assistant")
-            if last_msg:
-                agent_response = last_msg.text.value
-                if "BingGrounding" in selected_tools and last_msg.text.annotations:
-                    st.session_state.progress += 25
-                    progress_indicator.progress(st.session_state.progress, "Grounding using Bing...")
-                    citations = []
-                    for annotation in last_msg.text.annotations:
-                        citation_url = annotation.get("url_citation", {}).get("url")
-                        if citation_url:
-                            citations.append(f"{annotation.text}: {citation_url}")
-                    if citations:
-                        agent_response += "\n\n### Citations:\n" + "\n".join(f"- {c}" for c in citations)
-                images_found = False
-                python_code = None
-                image_md = ""
-                if "CodeInterpreter" in selected_tools:
-                    last_message_content = messages["data"][0].get("content", [None])
-                    images_found = any("image_contents" in msg for msg in last_message_content)
-                    if messages.image_contents:
-                        for image_content in messages.image_contents:
-                            images_found = True
-                            file_id = image_content.image_file.file_id
-                            images_dir = agent_conversations_path / st.session_state.session_id / "images"
-                            images_dir.mkdir(parents=True, exist_ok=True)
-                            file_name = images_dir / f"code_interpreter_result_{uuid.uuid4().hex[:8]}.png"
-                            project_client.agents.save_file(
-                                file_id=file_id,
-                                file_name=file_name.name,  # use only the filename
-                                target_dir=str(file_name.parent.resolve())  # specify target folder
-                            )
-                            image_md = f"![image]({file_name.as_posix()})"
-                        st.session_state.progress += 25
-                        progress_indicator.progress(st.session_state.progress, "Executing Code Interpreter...")
-                    run_details = project_client.agents.list_run_steps(
-                        thread_id=thread.id,
-                        run_id=run.id
-                    )
-                    for steps in run_details.data:
-                        if getattr(steps.step_details, 'type', None) == "tool_calls":
-                            for calls in steps.step_details.tool_calls:
-                                input_value = getattr(calls.code_interpreter, 'input', None) if hasattr(calls, 'code_interpreter') else None
-                                if input_value:
-                                    python_code = input_value
-                # Combine responses in one message.
-                combined_response = agent_response
-                if images_found:
-                    combined_response += "\n\n" + image_md
-                if python_code:
-                    combined_response += "\n\n**Used Python Code Snippet:**\n```python\n" + python_code + "\n```"
-                    #print(combined_response)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": combined_response
-                })
-                
-                with st.chat_message("assistant"):
-                    st.markdown(st_markdown(combined_response))
-                    print(st_markdown(combined_response))
-            else:
-                agent_response = "No response from agent"
+            agent_response = "No response from agent"
     save_session(st.session_state.session_id)
-    st.rerun()
-    progress_indicator.empty()
\ No newline at end of file
+    st.rerun()
\ No newline at end of file
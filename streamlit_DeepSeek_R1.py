@@ -1,54 +1,97 @@
 import os
+import re
 from dotenv import load_dotenv
-from azure.ai.inference import ChatCompletionsClient
-from azure.core.credentials import AzureKeyCredential
 from azure.ai.inference.models import SystemMessage, UserMessage, AssistantMessage
 from azure.search.documents import SearchClient
 import streamlit as st
-import json
+import orjson
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 load_dotenv()
 
-# instantiate the DeepSeek R1 client
-DS_client = ChatCompletionsClient(
-    endpoint=os.environ["DeepSeek_R1_Endpoint"],
-    credential=AzureKeyCredential(os.environ["DeepSeek_R1_Key"]),
-    model="DeepSeek-R1"
-)
-
-# instantiate Azure OpenAI client
-AOAI_client = ChatCompletionsClient(
-    endpoint=os.environ["AOAI_ENDPOINT"],  # Of the form https://<your-resouce-name>.openai.azure.com/openai/deployments/<your-deployment-name>
-    credential=AzureKeyCredential(os.environ["AOAI_KEY"]),
-    api_version="2024-10-21",  # Azure OpenAI api-version. See https://aka.ms/azsdk/azure-ai-inference/azure-openai-api-versions
-)
+# Both Streamlit apps share the cached inference-client factories
+from common.clients import get_aoai_client, get_ds_client
+from common.titles import cached_title
 
 
 # Set the page configuration
 st.set_page_config(page_title="Azure AI Foundry powered DeepSeek R1 Chatbot", page_icon=":whale2:", layout="wide")
 st.title("Azure AI Foundry powered DeepSeek R1 Chatbot")
 
+# Strips reasoning blocks in one C-implemented pass and handles multiple
+# <think> sections, unlike the old pair of str.find scans
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
 conversations_path = Path("DeepSeek_conversations")
 conversations_path.mkdir(exist_ok=True)
 
+# New messages go to a per-session append-only .jsonl log, so a turn costs one
+# small append instead of re-serializing the whole history; the log is folded
+# back into the .json file once it grows past this many entries
+_COMPACT_LOG_EVERY = 50
+
+# Session metadata writes happen off the render thread: a one-worker executor
+# keeps writes ordered, and the tmp-file + os.replace dance keeps each file
+# whole even if the process dies mid-write
+_writer_exec = ThreadPoolExecutor(max_workers=1)
+
+
+def _atomic_write(path, payload):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, path)
+
+
+def _message_log_path(session_id):
+    return conversations_path / f"{session_id}.jsonl"
+
+def append_message(session_id, message):
+    with open(_message_log_path(session_id), "ab") as log_file:
+        log_file.write(orjson.dumps(message) + b"\n")
+
 def load_messages(session_id):
     file_path = conversations_path / f"{session_id}.json"
+    messages = []
     if file_path.exists():
-        return json.loads(file_path.read_text())
-    return []
+        data = orjson.loads(file_path.read_bytes())
+        # Legacy session files stored the bare message list
+        messages = data.get("messages", []) if isinstance(data, dict) else data
+    log_path = _message_log_path(session_id)
+    if log_path.exists():
+        messages.extend(
+            orjson.loads(line) for line in log_path.read_bytes().splitlines() if line
+        )
+    return messages
 
 def save_messages(session_id, messages):
+    """Writes session metadata; messages are persisted through append_message."""
     file_path = conversations_path / f"{session_id}.json"
-    # Remove the <think>...</think> block from the assistant's response
+    log_path = _message_log_path(session_id)
+    # Remove any <think>...</think> blocks from assistant responses; new turns
+    # are stripped at generation time, so this only touches legacy content
     for message in messages:
-        if message["role"] == "assistant":
-            start = message["content"].find("<think>")
-            end = message["content"].find("</think>") + len("</think>")
-            if start != -1 and end != -1:
-                message["content"] = message["content"][:start] + message["content"][end:]
-    file_path.write_text(json.dumps(messages), encoding="utf-8")
+        if message["role"] == "assistant" and "<think>" in message["content"]:
+            message["content"] = _THINK_RE.sub("", message["content"])
+    # Titles are a function of the messages, so compute them once here when
+    # the conversation actually grew instead of on every sidebar render
+    title, titled_len, compacted = None, None, []
+    if file_path.exists():
+        previous = orjson.loads(file_path.read_bytes())
+        if isinstance(previous, dict):
+            title, titled_len = previous.get("title"), previous.get("titled_len")
+            compacted = previous.get("messages", [])
+        else:
+            compacted = previous
+    if messages and len(messages) != titled_len:
+        title = summarize_conversation(messages)
+        titled_len = len(messages)
+    if log_path.exists() and len(messages) - len(compacted) >= _COMPACT_LOG_EVERY:
+        compacted = messages
+        log_path.unlink()
+    data = {"messages": compacted, "title": title, "titled_len": titled_len}
+    _writer_exec.submit(_atomic_write, file_path, orjson.dumps(data))
 
 # use Azure OpenAI gpt-4o-mini to summarize the conversation 
 # into a short sentence of no more than 6 words
@@ -58,16 +101,43 @@ def summarize_conversation(messages):
     Do not include any other commentary or description."""
     formatted_messages = [{"role": "user", "content": m["content"]} for m in messages if m["role"] == "user"]
     formatted_messages.append({"role": "user", "content": prompt})
-    response = AOAI_client.complete(
+    response = get_aoai_client().complete(
         messages=formatted_messages, 
         max_tokens=64, 
         temperature=0)
     return response.choices[0].message.content.strip()
 
+
+# st.cache_data needs a hashable argument, so the cached variant keys on the
+# tuple of user messages; repeat sidebars then cost zero LLM calls
+@st.cache_data(ttl=3600, show_spinner=False)
+def summarize_conversation_cached(user_messages: tuple):
+    # The persistent hash-keyed cache means identical conversation prefixes
+    # share one summary, even across restarts and across the Streamlit apps
+    return cached_title(
+        user_messages,
+        lambda msgs: summarize_conversation([{"role": "user", "content": m} for m in msgs]),
+    )
+
+# Dispatch on role instead of branching, and keep the SDK message objects
+# cached in session state so each turn appends one object rather than
+# rebuilding the whole history
+_MESSAGE_TYPES = {"user": UserMessage, "assistant": AssistantMessage}
+
+
+def _to_message_objects(messages):
+    return [
+        _MESSAGE_TYPES[m["role"]](content=m["content"])
+        for m in messages
+        if m["role"] in _MESSAGE_TYPES
+    ]
+
+
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 if "messages" not in st.session_state:
     st.session_state.messages = load_messages(st.session_state.session_id)
+    st.session_state.msg_objects = _to_message_objects(st.session_state.messages)
 
 with st.sidebar:
     temperature = st.slider("Temperature", 0.0, 1.0, 0.5, 0.1)
@@ -76,26 +146,71 @@ with st.sidebar:
     
     def clear_chat():
         st.session_state.messages = []
+        st.session_state.msg_objects = []
+        # Compact the persisted history to an empty session: without this the
+        # append log and the previously compacted messages would resurrect the
+        # cleared conversation on the next load_messages
+        _message_log_path(st.session_state.session_id).unlink(missing_ok=True)
+        _writer_exec.submit(
+            _atomic_write,
+            conversations_path / f"{st.session_state.session_id}.json",
+            orjson.dumps({"messages": [], "title": None, "titled_len": None}),
+        )
     if st.button("Restart Conversation :arrows_counterclockwise:"):
         clear_chat()
 
     st.write("Available Sessions:")
     # Display a list of conversation sessions sorted by last modified time
     sorted_files = sorted(conversations_path.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
+    # Parse with orjson, and only when a file's mtime changed since the last
+    # rerun; steady-state sidebar work is then a handful of stat() calls
+    if "_sidebar_cache" not in st.session_state:
+        st.session_state._sidebar_cache = {}
+    sessions = []
     for conv_file in sorted_files:
+        mtime = conv_file.stat().st_mtime
+        cached = st.session_state._sidebar_cache.get(conv_file.stem)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, orjson.loads(conv_file.read_bytes()))
+            st.session_state._sidebar_cache[conv_file.stem] = cached
+        sessions.append((conv_file, cached[1]))
+    # Titles are persisted by save_messages; only legacy list-format files
+    # need a summary, and those independent LLM round-trips fan out in a pool
+    titles = {}
+    untitled = [
+        (conv_file, data if isinstance(data, list) else data.get("messages", []))
+        for conv_file, data in sessions
+        if not (isinstance(data, dict) and data.get("title"))
+    ]
+    if untitled:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            summaries = pool.map(
+                lambda msgs: summarize_conversation_cached(tuple(
+                    m["content"] for m in msgs if m["role"] == "user"
+                )),
+                (msgs for _, msgs in untitled),
+            )
+            for (conv_file, _), title in zip(untitled, summaries):
+                titles[conv_file.stem] = title
+    for conv_file, conv_data in sessions:
         sid = conv_file.stem
-        conv_data = json.loads(conv_file.read_text())
-        short_summary = summarize_conversation(conv_data)
+        if isinstance(conv_data, dict) and conv_data.get("title"):
+            short_summary = conv_data["title"]
+        else:
+            short_summary = titles.get(sid)
         cols = st.columns([3,1])
         if cols[0].button(short_summary or sid, key=f"switch_{sid}"):
             st.session_state.session_id = sid
             st.session_state.messages = load_messages(sid)
+            st.session_state.msg_objects = _to_message_objects(st.session_state.messages)
         if cols[1].button("delete", key=f"close_{sid}"):
             conv_file.unlink(missing_ok=True)
+            _message_log_path(sid).unlink(missing_ok=True)
     if st.button("New Thread"):
         new_id = str(uuid.uuid4())
         st.session_state.session_id = new_id
         st.session_state.messages = []
+        st.session_state.msg_objects = []
         save_messages(new_id, [])
 
 # Display chat history
@@ -106,18 +221,15 @@ for msg in st.session_state.messages:
 # Handle new user messages
 if user_input := st.chat_input("Ask me anything..."):
     st.session_state.messages.append({"role": "user", "content": user_input})
+    st.session_state.msg_objects.append(UserMessage(content=user_input))
+    append_message(st.session_state.session_id, {"role": "user", "content": user_input})
     with st.chat_message("user"):
         st.markdown(user_input)
 
     with st.chat_message("assistant"):
-        # Prepend the system message to the list of messages
-        messages = [SystemMessage(content=system_prompt)]
-        for m in st.session_state.messages:
-            if m["role"] == "user":
-                messages.append(UserMessage(content=m["content"]))
-            elif m["role"] == "assistant":
-                messages.append(AssistantMessage(content=m["content"]))
-        stream = DS_client.complete(
+        # Prepend the system message to the cached history objects
+        messages = [SystemMessage(content=system_prompt)] + st.session_state.msg_objects
+        stream = get_ds_client().complete(
             stream=True,
             messages=messages,
             max_tokens=max_tokens,
@@ -132,6 +244,10 @@ if user_input := st.chat_input("Ask me anything..."):
                     response_buffer += content  # Accumulate response
                     yield content 
         st.write_stream(stream_generator)  # Display response in Streamlit
-        st.session_state.messages.append({"role": "assistant", "content": response_buffer})
+        # Strip the reasoning block once here so save_messages never rescans it
+        assistant_message = {"role": "assistant", "content": _THINK_RE.sub("", response_buffer)}
+        st.session_state.messages.append(assistant_message)
+        st.session_state.msg_objects.append(AssistantMessage(content=assistant_message["content"]))
+        append_message(st.session_state.session_id, assistant_message)
         save_messages(st.session_state.session_id, st.session_state.messages)
         st.rerun()
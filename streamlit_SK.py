@@ -1,8 +1,14 @@
 import os
 import asyncio
-import json
 import uuid
-from pathlib import Path
+
+import nest_asyncio
+
+# Allow re-entrant run_until_complete on the cached loop; without this,
+# concurrent Streamlit sessions intermittently hit "Event loop is closed"
+nest_asyncio.apply()
+from concurrent.futures import ThreadPoolExecutor
+
 from dotenv import load_dotenv
 import streamlit as st
 import logging
@@ -12,6 +18,7 @@ from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoiceBehavior
 from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.contents import AuthorRole
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.functions import kernel_function
 from semantic_kernel.functions.kernel_arguments import KernelArguments
@@ -20,6 +27,8 @@ from semantic_kernel.connectors.ai.open_ai.prompt_execution_settings.azure_chat_
     AzureChatPromptExecutionSettings,
 )
 
+from common.convstore import ConversationStore
+
 # Load environment variables
 load_dotenv()
 
@@ -57,19 +66,52 @@ class LightsPlugin:
                 return light
         return None
 
-# Set up conversation management functions
-conversations_path = Path("SK_conversations")
-conversations_path.mkdir(exist_ok=True)
+# One persistent event loop per process: asyncio.run would tear down the loop
+# (and with it the HTTPX connection pool and TLS session behind
+# AzureChatCompletion) after every call
+@st.cache_resource(show_spinner=False)
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+# Conversations live in one SQLite DB rather than a file per session, so the
+# sidebar listing is a single indexed query instead of a glob + stat + parse
+# per file on every rerun
+@st.cache_resource(show_spinner=False)
+def get_store():
+    store = ConversationStore("SK_conversations.db")
+    # Pick up sessions saved by earlier versions as one JSON file each
+    store.migrate_dir("SK_conversations")
+    return store
+
+# A single-worker executor keeps DB writes off the user-visible turn while
+# preserving write order
+_writer_exec = ThreadPoolExecutor(max_workers=1)
+
+# Sessions shown in the sidebar before the "Older sessions" expander
+_SESSION_PAGE_SIZE = 20
 
 def load_messages(session_id):
-    file_path = conversations_path / f"{session_id}.json"
-    if file_path.exists():
-        return json.loads(file_path.read_text())
-    return []
+    return get_store().load(session_id)
+
+def heuristic_title(messages):
+    """Zero-cost default title: the first user message, truncated."""
+    return next(
+        (m["content"][:30] + ("..." if len(m["content"]) > 30 else "")
+         for m in messages if m["role"] == "user"),
+        None,
+    )
 
 def save_messages(session_id, messages):
-    file_path = conversations_path / f"{session_id}.json"
-    file_path.write_text(json.dumps(messages), encoding="utf-8")
+    # The cheap first-user-message title is stored at write time; LLM titling
+    # happens only when the user asks for it in the sidebar
+    summary = heuristic_title(messages) if messages else None
+    get_store().save(session_id, messages, summary=summary)
+
+def save_messages_async(session_id, messages):
+    """Persists a snapshot of `messages` without blocking the request path."""
+    _writer_exec.submit(save_messages, session_id, list(messages))
 
 # Use Azure OpenAI to summarize the conversation - make this synchronous
 def summarize_conversation(kernel, messages):
@@ -77,60 +119,103 @@ def summarize_conversation(kernel, messages):
         return "New conversation"
         
     try:
-        # Create a simple synchronous version that doesn't require async/await
+        # A short opener is already a usable title — skip the LLM entirely
+        first = messages[0]["content"]
+        if len(first) <= 40:
+            return first
+
+        # The answer is at most six words, so a truncated opener and a tight
+        # max_tokens keep the call an order of magnitude cheaper
         chat_history = ChatHistory()
-        # Just use the first few messages to create a summary
-        for m in messages[:3]:
-            if m["role"] == "user":
-                chat_history.add_user_message(m["content"])
-            elif m["role"] == "assistant":
-                chat_history.add_assistant_message(m["content"])
-        
+        chat_history.add_user_message(
+            f"Conversation opener: {first[:500]}\n\n"
+            "Summarize into a 6-word or less title. No quotes or punctuation."
+        )
+
         chat_completion = kernel.get_service(type=ChatCompletionClientBase)
-        prompt = "Summarize our conversation so far into a 6-word or less title. No quotes or punctuation."
-        chat_history.add_user_message(prompt)
-        
         execution_settings = AzureChatPromptExecutionSettings(
             temperature=0.0,
-            max_tokens=64
+            max_tokens=12
         )
-        
-        # Run the async function using asyncio.run() to get synchronous behavior
-        result = asyncio.run(chat_completion.get_chat_message_content(
+
+        # Drive the async call on the cached loop to get synchronous behavior
+        result = get_event_loop().run_until_complete(chat_completion.get_chat_message_content(
             chat_history=chat_history,
             settings=execution_settings
         ))
-        
+
         return str(result).strip()
     except Exception as e:
         st.error(f"Error generating summary: {str(e)}")
         return "Chat session"
 
-# Async version of the summarize function for later use
-async def async_summarize_conversation(kernel, messages):
+# One prompt can title many conversations at once: per-request overhead is
+# amortized and N sidebar round-trips collapse into one
+def batch_summarize(kernel, conversations):
+    """Summarizes several conversations with a single chat completion call."""
+    if not conversations:
+        return []
+    parts = [
+        "For each of the following conversations, output a title of 6 words or less "
+        f"on its own line, numbered 1..{len(conversations)}. No quotes or punctuation."
+    ]
+    for i, messages in enumerate(conversations, 1):
+        excerpt = "\n".join(f'{m["role"]}: {m["content"]}' for m in messages[:3])
+        parts.append(f"### Conversation {i}:\n{excerpt}")
     chat_history = ChatHistory()
-    for m in messages[:3]:
-        if m["role"] == "user":
-            chat_history.add_user_message(m["content"])
-        elif m["role"] == "assistant":
-            chat_history.add_assistant_message(m["content"])
-    
+    chat_history.add_user_message("\n\n".join(parts))
+
     chat_completion = kernel.get_service(type=ChatCompletionClientBase)
-    prompt = "Summarize our conversation so far into a 6-word or less title. No quotes or punctuation."
-    chat_history.add_user_message(prompt)
-    
     execution_settings = AzureChatPromptExecutionSettings(
         temperature=0.0,
-        max_tokens=64
+        max_tokens=64 * len(conversations)
     )
-    
-    result = await chat_completion.get_chat_message_content(
+    result = get_event_loop().run_until_complete(chat_completion.get_chat_message_content(
         chat_history=chat_history,
         settings=execution_settings
+    ))
+    titles = []
+    for line in str(result).splitlines():
+        line = line.strip()
+        if line:
+            # Drop the "1." / "2." numbering prefix
+            titles.append(line.split(".", 1)[-1].strip())
+    return titles
+
+# Azure OpenAI comfortably handles ~10 concurrent requests per session; the
+# semaphore keeps a large sidebar from exceeding that
+_SUMMARIZE_SEMAPHORE = asyncio.Semaphore(10)
+
+# Async version of the summarize function, used for concurrent fan-out
+async def async_summarize_conversation(kernel, messages):
+    first = messages[0]["content"] if messages else ""
+    if len(first) <= 40:
+        return first
+
+    chat_history = ChatHistory()
+    chat_history.add_user_message(
+        f"Conversation opener: {first[:500]}\n\n"
+        "Summarize into a 6-word or less title. No quotes or punctuation."
+    )
+
+    chat_completion = kernel.get_service(type=ChatCompletionClientBase)
+    execution_settings = AzureChatPromptExecutionSettings(
+        temperature=0.0,
+        max_tokens=12
     )
     
+    async with _SUMMARIZE_SEMAPHORE:
+        result = await chat_completion.get_chat_message_content(
+            chat_history=chat_history,
+            settings=execution_settings
+        )
+
     return str(result).strip()
 
+async def summarize_all(kernel, convs):
+    """Titles several conversations concurrently, one request each."""
+    return await asyncio.gather(*(async_summarize_conversation(kernel, c) for c in convs))
+
 # Initialize Semantic Kernel
 @st.cache_resource
 def initialize_kernel():
@@ -163,59 +248,145 @@ with st.sidebar:
     
     if st.button("Restart Conversation 🔄"):
         st.session_state.messages = []
-        save_messages(st.session_state.session_id, [])
+        st.session_state.pop("_prompt_sig", None)
+        # The rolling summary describes the turns just discarded
+        st.session_state.get("rolling_summaries", {}).pop(st.session_state.session_id, None)
+        save_messages_async(st.session_state.session_id, [])
 
     st.write("Available Sessions:")
-    sorted_files = sorted(conversations_path.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
-    
-    for conv_file in sorted_files:
-        sid = conv_file.stem
-        conv_data = json.loads(conv_file.read_text())
-        
-        # Get summary synchronously
-        if len(conv_data) > 0:
-            display_name = summarize_conversation(st.session_state.kernel, conv_data) or sid[:8]
+
+    # The session list is a fragment: titling and deleting rerun only this
+    # block, not the whole script; only switching sessions touches the main
+    # chat area and escalates to a full rerun
+    @st.fragment
+    def sidebar_sessions():
+        store = get_store()
+        rows = store.list_recent(limit=_SESSION_PAGE_SIZE)
+
+        # LLM titling is entirely on demand: rows render from the stored
+        # (cheap) summary, and this button upgrades every session in one
+        # batched call
+        if rows and st.button("✨ Auto-title sessions"):
+            convs = [(sid, store.load(sid)) for sid, _, _ in rows]
+            titles = batch_summarize(st.session_state.kernel, [c for _, c in convs])
+            if len(titles) != len(convs):
+                # The batched reply didn't split cleanly into one title per
+                # conversation; fall back to concurrent per-conversation requests
+                titles = get_event_loop().run_until_complete(
+                    summarize_all(st.session_state.kernel, [c for _, c in convs])
+                )
+            for (sid, _), title in zip(convs, titles):
+                store.set_summary(sid, title)
+            st.rerun()
+
+        def render_session_row(sid, summary):
+            display_name = summary or sid[:8]
             cols = st.columns([3,1])
-            
+
             if cols[0].button(display_name, key=f"switch_{sid}"):
                 st.session_state.session_id = sid
                 st.session_state.messages = load_messages(sid)
-                st.rerun()
+                st.rerun(scope="app")
 
             if cols[1].button("❌", key=f"delete_{sid}"):
-                conv_file.unlink(missing_ok=True)
+                store.delete(sid)
                 st.rerun()
+
+        for sid, summary, _ in rows:
+            render_session_row(sid, summary)
+
+        # Older sessions render inside a collapsed expander so the per-rerun
+        # UI cost stays bounded by the page size
+        older = store.list_recent(limit=100, offset=_SESSION_PAGE_SIZE)
+        if older:
+            with st.expander("Older sessions"):
+                for sid, summary, _ in older:
+                    render_session_row(sid, summary)
+
+    sidebar_sessions()
                 
     if st.button("New Thread"):
         new_id = str(uuid.uuid4())
         st.session_state.session_id = new_id
         st.session_state.messages = []
-        save_messages(new_id, [])
+        save_messages_async(new_id, [])
         st.rerun()
 
-# Display chat history
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
+# Display chat history; the columnar (roles, contents) view costs two str
+# refs per message instead of a dict lookup per field on every rerun
+if st.session_state.messages:
+    roles, contents = zip(*((m["role"], m["content"]) for m in st.session_state.messages))
+    for role, content in zip(roles, contents):
+        with st.chat_message(role):
+            st.markdown(content)
+
+# The ChatHistory lives in session state and is only rebuilt when the session
+# or system prompt changes; each turn appends two messages instead of
+# re-adding the whole transcript
+def get_chat_history():
+    prompt_sig = (st.session_state.session_id, system_prompt)
+    if st.session_state.get("_prompt_sig") != prompt_sig:
+        chat_history = ChatHistory()
+        chat_history.add_system_message(system_prompt)
+        for m in st.session_state.messages:
+            if m["role"] == "user":
+                chat_history.add_user_message(m["content"])
+            elif m["role"] == "assistant":
+                chat_history.add_assistant_message(m["content"])
+        st.session_state.chat_history = chat_history
+        st.session_state._prompt_sig = prompt_sig
+    return st.session_state.chat_history
+
+# Prompt tokens per turn grow with the square of session length if the whole
+# transcript is resent every time; beyond this many messages the older turns
+# are folded into a rolling summary instead
+MAX_TURNS = 12
+
+async def compact_history(kernel, chat_history):
+    """Returns a history capped to the last MAX_TURNS messages, with older
+    turns folded into a rolling summary kept per session."""
+    turns = [m for m in chat_history.messages if m.role != AuthorRole.SYSTEM]
+    if len(turns) <= MAX_TURNS:
+        return chat_history
+
+    old, recent = turns[:-MAX_TURNS], turns[-MAX_TURNS:]
+    summary_history = ChatHistory()
+    # Summaries are keyed by session id so switching sessions can't inject
+    # one conversation's summary into another's prompt
+    previous = st.session_state.get("rolling_summaries", {}).get(st.session_state.session_id)
+    if previous:
+        summary_history.add_user_message(f"Summary of the conversation so far: {previous}")
+    for m in old:
+        summary_history.add_message(m)
+    summary_history.add_user_message(
+        "Summarize the conversation above in at most 200 tokens, keeping facts, names and decisions."
+    )
+    chat_completion = kernel.get_service(type=ChatCompletionClientBase)
+    result = await chat_completion.get_chat_message_content(
+        chat_history=summary_history,
+        settings=AzureChatPromptExecutionSettings(temperature=0.0, max_tokens=200),
+    )
+    summary = str(result).strip()
+    st.session_state.setdefault("rolling_summaries", {})[st.session_state.session_id] = summary
+
+    compacted = ChatHistory()
+    compacted.add_system_message(system_prompt)
+    compacted.add_system_message(f"Summary of the earlier conversation: {summary}")
+    for m in recent:
+        compacted.add_message(m)
+    st.session_state.chat_history = compacted
+    return compacted
+
+# Process user input, streaming tokens into the placeholder as they arrive so
+# the user sees first-token latency rather than full-response latency
+async def process_message(kernel, user_input, chat_history, placeholder):
+    # Fold turns beyond the sliding window into the rolling summary so the
+    # prompt stays a bounded size
+    chat_history = await compact_history(kernel, chat_history)
 
-# Process user input
-async def process_message(kernel, user_input, messages):
-    # Create a ChatHistory from the messages
-    chat_history = ChatHistory()
-    
-    # Add system message
-    chat_history.add_system_message(system_prompt)
-    
-    # Add previous messages to history
-    for m in messages:
-        if m["role"] == "user":
-            chat_history.add_user_message(m["content"])
-        elif m["role"] == "assistant":
-            chat_history.add_assistant_message(m["content"])
-    
     # Add current user input
     chat_history.add_user_message(user_input)
-    
+
     # Setup execution settings
     execution_settings = AzureChatPromptExecutionSettings(
         temperature=temperature,
@@ -225,38 +396,45 @@ async def process_message(kernel, user_input, messages):
     # Get the chat completion service
     chat_completion = kernel.get_service(type=ChatCompletionClientBase)
     
-    # Get response
-    result = await chat_completion.get_chat_message_content(
+    # Stream the response, updating the placeholder per chunk
+    buffer = ""
+    async for chunk in chat_completion.get_streaming_chat_message_content(
         chat_history=chat_history,
         settings=execution_settings,
         kernel=kernel
-    )
-    
-    return str(result)
+    ):
+        if chunk.content:
+            buffer += chunk.content
+            placeholder.markdown(buffer + "▌")
+
+    placeholder.markdown(buffer)
+    chat_history.add_assistant_message(buffer)
+    return buffer
 
 # Handle new user messages
 if user_input := st.chat_input("Ask about your smart home..."):
+    # Resolve the history before recording the user turn so a rebuild doesn't
+    # pick the new message up twice
+    chat_history = get_chat_history()
     st.session_state.messages.append({"role": "user", "content": user_input})
     with st.chat_message("user"):
         st.markdown(user_input)
-    
+
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
-        
-        # Process the message using Semantic Kernel
-        with st.spinner("Thinking..."):
-            response = asyncio.run(
-                process_message(
-                    st.session_state.kernel,
-                    user_input,
-                    st.session_state.messages
-                )
+
+        # Process the message using Semantic Kernel, streaming into the placeholder
+        response = get_event_loop().run_until_complete(
+            process_message(
+                st.session_state.kernel,
+                user_input,
+                chat_history,
+                message_placeholder
             )
-        
-        message_placeholder.markdown(response)
+        )
     
     # Add assistant response to messages
     st.session_state.messages.append({"role": "assistant", "content": response})
-    
-    # Save the conversation
-    save_messages(st.session_state.session_id, st.session_state.messages)
\ No newline at end of file
+
+    # Save the conversation off the request path
+    save_messages_async(st.session_state.session_id, st.session_state.messages)
\ No newline at end of file
@@ -1,8 +1,18 @@
 import os
 import asyncio
-import json
+import atexit
+import re
+import time
 import uuid
-from pathlib import Path
+
+import nest_asyncio
+
+# Allow re-entrant run_until_complete on the cached loop; without this,
+# concurrent Streamlit sessions intermittently hit "Event loop is closed"
+nest_asyncio.apply()
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 from dotenv import load_dotenv
 import streamlit as st
 from opentelemetry import trace
@@ -14,12 +24,18 @@ from semantic_kernel.agents.strategies import TerminationStrategy
 from semantic_kernel.contents import AuthorRole, ChatMessageContent
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 
+from common.convstore import ConversationStore
+
 # Load environment variables
 load_dotenv()
 
 # Initialize tracing
 tracer = trace.get_tracer(__name__)
 
+# Compiled once; case-insensitive so the hot termination check avoids
+# lowercasing a copy of the full message every iteration
+_APPROVED_RE = re.compile(r"\bapproved\b", re.IGNORECASE)
+
 # Define the termination strategy class - simpler approach from the step3 example
 class ApprovalTerminationStrategy(TerminationStrategy):
     """A strategy for determining when an agent should terminate."""
@@ -28,21 +44,47 @@ class ApprovalTerminationStrategy(TerminationStrategy):
         """Check if the agent should terminate."""
         if not history or len(history) == 0:
             return False
-        return "approved" in history[-1].content.lower()
+        # The approval verdict appears at the end of the reviewer's message,
+        # so scanning the tail is enough
+        return bool(_APPROVED_RE.search(history[-1].content[-256:]))
+
+# One persistent event loop per process: asyncio.run would tear down the loop
+# (and the SDK connection pools behind it) after every user turn
+@st.cache_resource(show_spinner=False)
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+# Conversations live in one SQLite DB rather than a file per session, so the
+# sidebar listing is a single indexed query instead of a glob + stat + parse
+# per file on every rerun
+@st.cache_resource(show_spinner=False)
+def get_store():
+    store = ConversationStore("AgentGroupChat_conversations.db")
+    # Pick up sessions saved by earlier versions as one JSON file each
+    store.migrate_dir("AgentGroupChat_conversations")
+    return store
+
+# A single-worker executor keeps DB writes off the user-visible turn while
+# preserving write order
+_writer_exec = ThreadPoolExecutor(max_workers=1)
 
-# Set up conversation management functions
-conversations_path = Path("AgentGroupChat_conversations")
-conversations_path.mkdir(exist_ok=True)
+# Sessions shown in the sidebar before the "Older sessions" expander
+_SESSION_PAGE_SIZE = 20
 
 def load_messages(session_id):
-    file_path = conversations_path / f"{session_id}.json"
-    if file_path.exists():
-        return json.loads(file_path.read_text())
-    return []
+    return get_store().load(session_id)
 
 def save_messages(session_id, messages):
-    file_path = conversations_path / f"{session_id}.json"
-    file_path.write_text(json.dumps(messages), encoding="utf-8")
+    # The cheap first-user-message title is computed at write time so the
+    # sidebar never needs to load message bodies
+    summary = summarize_conversation(messages) if messages else None
+    get_store().save(session_id, messages, summary=summary)
+
+def save_messages_async(session_id, messages):
+    """Persists a snapshot of `messages` without blocking the request path."""
+    _writer_exec.submit(save_messages, session_id, list(messages))
 
 # Create a simple function to summarize conversations
 def summarize_conversation(messages):
@@ -62,35 +104,93 @@ def summarize_conversation(messages):
         st.error(f"Error generating summary: {str(e)}")
         return "Chat session"
 
-# Function to get an appropriate emoji avatar based on agent name
+# Map common agent names to emojis, lowercased once at import so lookups
+# don't re-lower every key per call
+_AVATAR_MAP_LOWER = {
+    "artdirector": "🎨",
+    "copywriter": "✍️",
+    "reviewer": "👓",
+    "editor": "📝",
+    "designer": "🖌️",
+    "marketer": "📊",
+    "writer": "📚",
+    "assistant": "💬",
+}
+
+# Function to get an appropriate emoji avatar based on agent name; memoized
+# because the same handful of names repeat on every message render
+@lru_cache(maxsize=256)
 def get_agent_avatar(agent_name):
-    # Default to a robot emoji if no match is found
-    default_avatar = "🤖"
-    
-    # Map common agent names to emojis
-    avatar_map = {
-        "ArtDirector": "🎨",
-        "CopyWriter": "✍️",
-        "Reviewer": "👓",
-        "Editor": "📝",
-        "Designer": "🖌️",
-        "Marketer": "📊",
-        "Writer": "📚",
-        "Assistant": "💬",
-    }
-    
+    name_lower = agent_name.lower()
+
     # Try to match the full name first
-    if agent_name in avatar_map:
-        return avatar_map[agent_name]
-        
-    # Try to match partial names
-    for key in avatar_map:
-        if key.lower() in agent_name.lower():
-            return avatar_map[key]
-            
-    return default_avatar
+    if name_lower in _AVATAR_MAP_LOWER:
+        return _AVATAR_MAP_LOWER[name_lower]
 
-# Function to create a Kernel instance with Azure OpenAI service
+    # Try to match partial names, defaulting to a robot emoji
+    return next((v for k, v in _AVATAR_MAP_LOWER.items() if k in name_lower), "🤖")
+
+# Credential acquisition (managed-identity/IMDS probing) and project-client
+# setup cost hundreds of ms, so both are created once per process rather than
+# per user turn
+@st.cache_resource(show_spinner=False)
+def get_azure_ai_client():
+    creds = DefaultAzureCredential()
+    client = AzureAIAgent.create_client(credential=creds)
+    return creds, client
+
+# Remote agents created through the service are server-side resources; track
+# them so they are deleted when the process exits instead of leaking
+_created_agent_ids = set()
+
+def _cleanup_remote_agents():
+    # Nothing to delete, so don't build a credential, client or loop just to
+    # find that out at interpreter shutdown
+    if not _created_agent_ids:
+        return
+    try:
+        _, client = get_azure_ai_client()
+        loop = get_event_loop()
+    except Exception:
+        # At teardown the cache_resource factories may fail (no script
+        # context); leaking the agents beats an atexit traceback
+        return
+    for agent_id in list(_created_agent_ids):
+        try:
+            loop.run_until_complete(client.agents.delete_agent(agent_id))
+        except Exception:
+            pass
+        _created_agent_ids.discard(agent_id)
+
+atexit.register(_cleanup_remote_agents)
+
+async def get_copywriter_definition(client, name, instructions):
+    """Returns the remote copywriter agent, recreating it only when its name
+    or instructions change."""
+    key = (name, instructions)
+    if st.session_state.get("_copywriter_key") != key:
+        old = st.session_state.get("_copywriter_definition")
+        if old is not None:
+            try:
+                await client.agents.delete_agent(old.id)
+                _created_agent_ids.discard(old.id)
+            except Exception:
+                pass
+        settings = AzureAIAgentSettings.create()
+        definition = await client.agents.create_agent(
+            model=settings.model_deployment_name,
+            name=name,
+            instructions=instructions,
+        )
+        _created_agent_ids.add(definition.id)
+        st.session_state._copywriter_definition = definition
+        st.session_state._copywriter_key = key
+    return st.session_state._copywriter_definition
+
+# Function to create a Kernel instance with Azure OpenAI service; cached so
+# every turn reuses the same AzureChatCompletion client and its keep-alive
+# connection pool instead of rebuilding both
+@st.cache_resource(show_spinner=False)
 def create_kernel() -> Kernel:
     """Creates a Kernel instance with an Azure OpenAI ChatCompletion service."""
     kernel = Kernel()
@@ -143,35 +243,50 @@ Consider suggestions when refining an idea.""")
     
     if st.button("Restart Conversation 🔄"):
         st.session_state.messages = []
-        save_messages(st.session_state.session_id, [])
+        save_messages_async(st.session_state.session_id, [])
         st.rerun()
 
     # Session management
     st.write("Available Sessions:")
-    sorted_files = sorted(conversations_path.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True)
-    
-    for conv_file in sorted_files:
-        sid = conv_file.stem
-        conv_data = json.loads(conv_file.read_text())
-        
-        # Get summary for display
-        display_name = summarize_conversation(conv_data) or sid[:8]
-        cols = st.columns([3,1])
-        
-        if cols[0].button(display_name, key=f"switch_{sid}"):
-            st.session_state.session_id = sid
-            st.session_state.messages = load_messages(sid)
-            st.rerun()
-
-        if cols[1].button("❌", key=f"delete_{sid}"):
-            conv_file.unlink(missing_ok=True)
-            st.rerun()
+
+    # The session list is a fragment: deleting reruns only this block; only
+    # switching sessions touches the main chat area and escalates to a full
+    # rerun
+    @st.fragment
+    def sidebar_sessions():
+        store = get_store()
+
+        def render_session_row(sid, summary):
+            display_name = summary or sid[:8]
+            cols = st.columns([3,1])
+
+            if cols[0].button(display_name, key=f"switch_{sid}"):
+                st.session_state.session_id = sid
+                st.session_state.messages = load_messages(sid)
+                st.rerun(scope="app")
+
+            if cols[1].button("❌", key=f"delete_{sid}"):
+                store.delete(sid)
+                st.rerun()
+
+        for sid, summary, _ in store.list_recent(limit=_SESSION_PAGE_SIZE):
+            render_session_row(sid, summary)
+
+        # Older sessions render inside a collapsed expander so the per-rerun
+        # UI cost stays bounded by the page size
+        older = store.list_recent(limit=100, offset=_SESSION_PAGE_SIZE)
+        if older:
+            with st.expander("Older sessions"):
+                for sid, summary, _ in older:
+                    render_session_row(sid, summary)
+
+    sidebar_sessions()
             
     if st.button("New Thread"):
         new_id = str(uuid.uuid4())
         st.session_state.session_id = new_id
         st.session_state.messages = []
-        save_messages(new_id, [])
+        save_messages_async(new_id, [])
         st.rerun()
 
 # Display chat history
@@ -197,117 +312,148 @@ async def run_agent_group_chat(user_input):
     try:
         # Create a single kernel instance for all agents.
         kernel = create_kernel()
-        az_ai_agent_settings = AzureAIAgentSettings.create()
-        # Initialize agents and client for Azure AI Agent
-        async with (
-            DefaultAzureCredential() as creds,
-            AzureAIAgent.create_client(credential=creds) as client,
-        ):
-            # Create reviewer agent using ChatCompletionAgents approach.
-            agent_reviewer = ChatCompletionAgent(
-                kernel=kernel,
-                name=reviewer_name,
-                instructions=reviewer_instructions,
-            )
-            # Create the copywriter agent using Azure AI Agent Service approach.
-            copy_writer_agent_definition = await client.agents.create_agent(
-                model=az_ai_agent_settings.model_deployment_name,
-                name=copywriter_name,
-                instructions=copywriter_instructions,
-            )
-            agent_writer = AzureAIAgent(
-                client=client,
-                definition=copy_writer_agent_definition,
-            )
-            
-            # Place the agents in a group chat with the termination strategy
-            chat = AgentGroupChat(
-                agents=[agent_writer, agent_reviewer],
-                termination_strategy=ApprovalTerminationStrategy(
-                    agents=[agent_reviewer], 
-                    maximum_iterations=max_iterations
-                ),
-            )
+        # Reuse the cached credential/client and remote agent across turns
+        _, client = get_azure_ai_client()
+        # Create reviewer agent using ChatCompletionAgents approach.
+        agent_reviewer = ChatCompletionAgent(
+            kernel=kernel,
+            name=reviewer_name,
+            instructions=reviewer_instructions,
+        )
+        # Reuse the copywriter agent from Azure AI Agent Service.
+        copy_writer_agent_definition = await get_copywriter_definition(
+            client, copywriter_name, copywriter_instructions
+        )
+        agent_writer = AzureAIAgent(
+            client=client,
+            definition=copy_writer_agent_definition,
+        )
+
+        # Place the agents in a group chat with the termination strategy
+        chat = AgentGroupChat(
+            agents=[agent_writer, agent_reviewer],
+            termination_strategy=ApprovalTerminationStrategy(
+                agents=[agent_reviewer], 
+                maximum_iterations=max_iterations
+            ),
+        )
+        
+        try:
+            # Add user message to the chat
+            await chat.add_chat_message(message=user_input)
             
-            try:
-                # Add user message to the chat
-                await chat.add_chat_message(message=user_input)
-                
-                # Create a container for live updates during processing
-                live_update_container = st.empty()
-                
-                # Process messages and display them one after the other
-                responses = []
-                final_response = None
-                final_agent = None
-                is_approved = False
-                
+            # Create the live-update placeholders once; per-message updates
+            # below rewrite only their own slot instead of rebuilding the
+            # whole container per iteration
+            live_update_container = st.container()
+            with live_update_container:
+                header_ph = st.empty()
+                body_ph = st.empty()
+
+            # Process messages and display them one after the other; frames
+            # are deduplicated by hash and throttled to ~10 Hz so unchanged
+            # or near-instant updates don't flood the websocket
+            responses = []
+            final_response = None
+            final_agent = None
+            is_approved = False
+            last_hash = None
+            last_flush = 0.0
+
+            def record_response(agent, response_text):
+                nonlocal final_response, final_agent, is_approved
+                responses.append({
+                    "agent": agent,
+                    "content": response_text
+                })
+
+                # Check if this is the approval message
+                if agent == reviewer_name and _APPROVED_RE.search(response_text):
+                    is_approved = True
+                    final_agent = agent
+                    final_response = response_text
+
+                # If not approved yet, record the latest response from the copywriter
+                if not is_approved and agent == copywriter_name:
+                    final_agent = agent
+                    final_response = response_text
+
+            def render_frame(agent, response_text):
+                nonlocal last_hash, last_flush
+                frame_hash = hash(response_text)
+                now = time.perf_counter()
+                if frame_hash != last_hash and now - last_flush > 0.1:
+                    header_ph.write(f"💭 {get_agent_avatar(agent)} **{agent}** is thinking...")
+                    body_ph.markdown(f"{response_text}")
+                    last_hash = frame_hash
+                    last_flush = now
+
+            if hasattr(chat, "invoke_stream"):
+                # Token-level streaming: deltas render as they arrive, so the
+                # first visible token appears at first-token latency instead
+                # of full-message latency
+                current_agent = None
+                buffer = ""
+                async for delta in chat.invoke_stream():
+                    if delta.role != AuthorRole.ASSISTANT:
+                        continue
+                    agent = delta.name or "Assistant"
+                    if current_agent is not None and agent != current_agent:
+                        record_response(current_agent, buffer)
+                        buffer = ""
+                    current_agent = agent
+                    buffer += delta.content or ""
+                    render_frame(current_agent, buffer)
+                if current_agent is not None and buffer:
+                    record_response(current_agent, buffer)
+            else:
+                # Fallback: whole messages, displayed one after the other
                 async for content in chat.invoke():
                     if content.role == AuthorRole.ASSISTANT:
                         agent = content.name or "Assistant"
-                        response_text = content.content
-                        
-                        # Add to responses list
-                        responses.append({
-                            "agent": agent,
-                            "content": response_text
-                        })
-                        
-                        # Check if this is the approval message
-                        if agent == reviewer_name and "approved" in response_text.lower():
-                            is_approved = True
-                            final_agent = agent
-                            final_response = response_text
-                        
-                        # If not approved yet, record the latest response from the copywriter
-                        if not is_approved and agent == copywriter_name:
-                            final_agent = agent
-                            final_response = response_text
-                        
-                        # Display only the current message in the live update container
-                        with live_update_container.container():
-                            st.write(f"💭 {get_agent_avatar(agent)} **{agent}** is thinking...")
-                            st.markdown(f"{response_text}")
-                
-                # Clear the live update container once processing is complete
-                live_update_container.empty()
-                
-                # Prepare the inner monologue for saving
-                formatted_responses = [f"{get_agent_avatar(r['agent'])} **{r['agent']}**: {r['content']}" for r in responses]
-                inner_monologue_text = "\n\n".join(formatted_responses)
-                
-                # Prepare the final response
-                if final_response:
-                    if is_approved:
-                        # For approved content, extract the copywriter's latest proposal
-                        copywriter_responses = [r for r in responses if r["agent"] == copywriter_name]
-                        if copywriter_responses:
-                            final_proposal = copywriter_responses[-1]["content"]
-                            final_result = f"**Final Approved Copy:**\n\n{final_proposal}\n\n{get_agent_avatar(reviewer_name)} *Approved by {reviewer_name}*"
-                        else:
-                            final_result = f"{get_agent_avatar(final_agent)} **{final_agent}**: {final_response}"
+                        record_response(agent, content.content)
+                        render_frame(agent, content.content)
+
+            # Clear the live update placeholders once processing is complete
+            header_ph.empty()
+            body_ph.empty()
+            
+            # Prepare the inner monologue for saving
+            formatted_responses = [f"{get_agent_avatar(r['agent'])} **{r['agent']}**: {r['content']}" for r in responses]
+            inner_monologue_text = "\n\n".join(formatted_responses)
+            
+            # Prepare the final response
+            if final_response:
+                if is_approved:
+                    # For approved content, extract the copywriter's latest proposal
+                    copywriter_responses = [r for r in responses if r["agent"] == copywriter_name]
+                    if copywriter_responses:
+                        final_proposal = copywriter_responses[-1]["content"]
+                        final_result = f"**Final Approved Copy:**\n\n{final_proposal}\n\n{get_agent_avatar(reviewer_name)} *Approved by {reviewer_name}*"
                     else:
-                        # For non-approved content, show the latest message
                         final_result = f"{get_agent_avatar(final_agent)} **{final_agent}**: {final_response}"
                 else:
-                    final_result = "No response generated."
-                
+                    # For non-approved content, show the latest message
+                    final_result = f"{get_agent_avatar(final_agent)} **{final_agent}**: {final_response}"
+            else:
+                final_result = "No response generated."
+            
+            await chat.reset()
+            
+            # Return both the inner monologue and final result
+            return {
+                "inner_monologue": inner_monologue_text,
+                "final_response": final_result
+            }
+            
+        except Exception as e:
+            st.error(f"Error in agent chat: {str(e)}")
+            try:
                 await chat.reset()
+            except Exception:
+                pass
                 
-                # Return both the inner monologue and final result
-                return {
-                    "inner_monologue": inner_monologue_text,
-                    "final_response": final_result
-                }
-                
-            except Exception as e:
-                st.error(f"Error in agent chat: {str(e)}")
-                try:
-                    await chat.reset()
-                except Exception:
-                    pass
-                    
-                return f"Error: {str(e)}"
+            return f"Error: {str(e)}"
     except Exception as e:
         return f"Configuration error: {str(e)}"
 
@@ -320,7 +466,7 @@ if user_input := st.chat_input("Enter your request for the agents..."):
     
     # Process with Azure AI Agent Group Chat
     with st.spinner("Agents are collaborating on your request..."):
-        response = asyncio.run(run_agent_group_chat(user_input))
+        response = get_event_loop().run_until_complete(run_agent_group_chat(user_input))
         
     # Save the response (could be a string error message or a dict with inner_monologue and final_response)
     if isinstance(response, dict):
@@ -335,8 +481,8 @@ if user_input := st.chat_input("Enter your request for the agents..."):
         # Save error message
         st.session_state.messages.append({"role": "assistant", "content": response})
     
-    # Save the conversation
-    save_messages(st.session_state.session_id, st.session_state.messages)
-    
+    # Save the conversation off the request path
+    save_messages_async(st.session_state.session_id, st.session_state.messages)
+
     # Force a rerun to make sure the latest messages are shown
     st.rerun()